@@ -0,0 +1,66 @@
+
+import asyncio
+
+from pymongo.errors import DuplicateKeyError
+
+from server import client, db, pair_key, move_embedded_messages, with_version, conversation_written
+
+async def merge_into(keep: dict, dup: dict):
+    """Fold a duplicate conversation of the same pair into `keep` and delete it."""
+    if 'messages' in dup:
+        await move_embedded_messages(dup)
+        dup = await db.conversations.find_one({"_id": dup['_id']})
+    await db.messages.update_many({"conversationId": dup['_id']}, {"$set": {"conversationId": keep['_id']}})
+
+    updates = {
+        "$inc": {"messageCount": dup.get('messageCount', 0)},
+        "$max": {"timerStarted": dup.get('timerStarted') or 0},
+    }
+    if (dup.get('lastMessageTime') or 0) > (keep.get('lastMessageTime') or 0):
+        updates["$set"] = {"last": dup.get('last'), "lastMessageTime": dup['lastMessageTime']}
+    await db.conversations.update_one({"_id": keep['_id']}, with_version(updates))
+    await db.conversations.delete_one({"_id": dup['_id']})
+    # Moves the GET /conversations ETags of both participants
+    await conversation_written(keep['participants'])
+
+async def backfill_pair_keys():
+    """Stamp every conversation with its canonical pairKey.
+
+    Conversations created before the unique pairKey index may exist twice for
+    the same pair (concurrent first messages); the API keys one of them on
+    first access (server.key_legacy_conversation) and the others stay hidden
+    until this runs. Duplicates are merged into the keyed conversation,
+    messages included. Run right after deploying; safe to re-run.
+    """
+    print("Backfilling conversation pair keys...")
+    
+    stamped = 0
+    merged = 0
+    cursor = db.conversations.find({"pairKey": {"$exists": False}}, {"messages": 0}).sort("_id", 1)
+    async for conv in cursor:
+        if len(set(conv.get('participants', []))) != 2:
+            print(f"Conversation {conv['_id']}: skipped (participants {conv.get('participants')})")
+            continue
+        key = pair_key(*conv['participants'])
+        
+        keep = await db.conversations.find_one({"pairKey": key}, {"messages": 0})
+        if not keep:
+            try:
+                await db.conversations.update_one({"_id": conv['_id']}, {"$set": {"pairKey": key}})
+                stamped += 1
+                continue
+            except DuplicateKeyError:
+                # The API created the pair's keyed conversation since the lookup
+                keep = await db.conversations.find_one({"pairKey": key}, {"messages": 0})
+        if keep['_id'] == conv['_id']:
+            continue  # Keyed since the scan started
+        await merge_into(keep, await db.conversations.find_one({"_id": conv['_id']}))
+        merged += 1
+        print(f"Conversation {conv['_id']}: merged into {keep['_id']}")
+    
+    print(f"Backfill complete. Stamped {stamped}, merged {merged} duplicate conversations.")
+    
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(backfill_pair_keys())
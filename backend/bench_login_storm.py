@@ -0,0 +1,102 @@
+"""Benchmark what a burst of logins does to everything else on the worker.
+
+Drives the FastAPI app in-process through httpx's ASGI transport. A few
+readers poll GET /api/users/{id} the whole time while `--logins` logins hit
+POST /api/auth/login at once. Reports:
+
+- event-loop lag: how late a 10 ms ticker wakes up
+- p50/p99 latency of the unrelated reads, before and during the storm
+- login outcomes (503s show the bcrypt pool turning work away)
+
+Uses a throwaway database (BENCH_DB_NAME, default aviato_bench) that is dropped
+afterwards. Run it on two commits to compare:
+
+    python bench_login_storm.py --logins 100
+"""
+
+import os
+import time
+import asyncio
+import argparse
+from collections import Counter
+
+import httpx
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import server
+
+BENCH_DB_NAME = os.environ.get('BENCH_DB_NAME', 'aviato_bench')
+TICK = 0.01
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+async def watch_loop_lag(lags, stop):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append((time.perf_counter() - start - TICK) * 1000)
+
+async def poll_reads(http, user_id, latencies, stop):
+    while not stop.is_set():
+        start = time.perf_counter()
+        r = await http.get(f"/api/users/{user_id}")
+        r.raise_for_status()
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0.005)
+
+async def measure(http, user_id, readers, seconds=None, storm=None):
+    """Lag and read latencies while `storm` runs (or for `seconds` when idle)."""
+    lags, reads, stop = [], [], asyncio.Event()
+    tasks = [asyncio.ensure_future(watch_loop_lag(lags, stop))]
+    tasks += [asyncio.ensure_future(poll_reads(http, user_id, reads, stop)) for _ in range(readers)]
+    result = None
+    if storm is None:
+        await asyncio.sleep(seconds)
+    else:
+        result = await storm
+    stop.set()
+    await asyncio.gather(*tasks)
+    return lags, reads, result
+
+async def run(logins: int, readers: int):
+    server.client = AsyncIOMotorClient(server.MONGO_URL)
+    server.db = server.client[BENCH_DB_NAME]
+    await server.client.drop_database(BENCH_DB_NAME)
+    await server.ensure_indexes()
+
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as http:
+        r = await http.post("/api/auth/signup", json={"email": "storm@bench.example.com", "password": "pass", "name": "storm"})
+        r.raise_for_status()
+        user_id = r.json()['user']['id']
+
+        async def storm():
+            started = time.perf_counter()
+            responses = await asyncio.gather(*[
+                http.post("/api/auth/login", data={"username": "storm@bench.example.com", "password": "pass"})
+                for _ in range(logins)
+            ])
+            return Counter(r.status_code for r in responses), time.perf_counter() - started
+
+        idle_lags, idle_reads, _ = await measure(http, user_id, readers, seconds=2)
+        storm_lags, storm_reads, (codes, elapsed) = await measure(http, user_id, readers, storm=storm())
+
+    await server.client.drop_database(BENCH_DB_NAME)
+
+    print(f"{logins} logins in {elapsed:.1f}s: " + ", ".join(f"{n} x {code}" for code, n in sorted(codes.items())))
+    print(f"{'phase':<7} {'lag p50':>8} {'lag p99':>8} {'lag max':>8} {'reads':>6} {'read p50':>9} {'read p99':>9}")
+    for phase, lags, reads in (("idle", idle_lags, idle_reads), ("storm", storm_lags, storm_reads)):
+        print(
+            f"{phase:<7} {percentile(lags, 50):>8.1f} {percentile(lags, 99):>8.1f} {max(lags):>8.1f} "
+            f"{len(reads):>6} {percentile(reads, 50):>9.1f} {percentile(reads, 99):>9.1f}"
+        )
+    print("(all times in ms)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Event-loop lag and read latency during a login storm")
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--readers", type=int, default=4, help="Concurrent clients polling an unrelated endpoint")
+    args = parser.parse_args()
+    asyncio.run(run(args.logins, args.readers))
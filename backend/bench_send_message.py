@@ -0,0 +1,96 @@
+"""Benchmark POST /api/conversations/{user_id}/messages in-process against MongoDB.
+
+Drives the FastAPI app through httpx's ASGI transport (no network hop) and
+counts the MongoDB commands each request issues with pymongo command
+monitoring. Reports commands per request and p50/p99 latency for a sender's
+first message (Orange slot + conversation creation) and for follow-ups.
+
+Uses a throwaway database (BENCH_DB_NAME, default aviato_bench) that is dropped
+afterwards. Run it on two commits to compare:
+
+    python bench_send_message.py --senders 50 --messages 10
+"""
+
+import os
+import time
+import asyncio
+import argparse
+import statistics
+
+import httpx
+from pymongo import monitoring
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import server
+from media import MediaStore
+
+BENCH_DB_NAME = os.environ.get('BENCH_DB_NAME', 'aviato_bench')
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+async def signup(http, name):
+    r = await http.post("/api/auth/signup", json={"email": f"{name}@bench.example.com", "password": "pass", "name": name})
+    r.raise_for_status()
+    data = r.json()
+    return {"Authorization": f"Bearer {data['access_token']}"}, data['user']['id']
+
+async def run(senders: int, messages: int):
+    counter = CommandCounter()
+    server.client = AsyncIOMotorClient(server.MONGO_URL, event_listeners=[counter])
+    server.db = server.client[BENCH_DB_NAME]
+    server.media = MediaStore(server.db)
+    await server.client.drop_database(BENCH_DB_NAME)
+    await server.ensure_indexes()
+
+    samples = {"first message": [], "follow-up": []}
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        target_headers, target_id = await signup(http, "target")
+        r = await http.put(f"/api/users/{target_id}", headers=target_headers, json={
+            "availabilityMode": "orange",
+            "availability": {"maxContact": senders + 1}
+        })
+        r.raise_for_status()
+
+        for i in range(senders):
+            headers, _ = await signup(http, f"sender{i}")
+            for j in range(messages):
+                before = counter.count
+                start = time.perf_counter()
+                r = await http.post(f"/api/conversations/{target_id}/messages", headers=headers, json={"text": f"msg {j}"})
+                elapsed = (time.perf_counter() - start) * 1000
+                r.raise_for_status()
+                # Includes get_current_user's user lookup
+                samples["first message" if j == 0 else "follow-up"].append((counter.count - before, elapsed))
+
+    await server.client.drop_database(BENCH_DB_NAME)
+
+    print(f"{'scenario':<15} {'n':>6} {'cmds/req':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, rows in samples.items():
+        if not rows:
+            continue
+        cmds = [c for c, _ in rows]
+        lat = [t for _, t in rows]
+        print(f"{name:<15} {len(rows):>6} {statistics.mean(cmds):>9.2f} {percentile(lat, 50):>8.2f} {percentile(lat, 99):>8.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the send_message write path")
+    parser.add_argument("--senders", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=10, help="Messages per sender")
+    args = parser.parse_args()
+    asyncio.run(run(args.senders, args.messages))
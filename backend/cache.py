@@ -0,0 +1,178 @@
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from metrics import counters, ratio
+
+# Every cache by name, for GET /stats (anything with stats())
+CACHES: Dict[str, Any] = {}
+
+_MISSING = object()
+
+class TTLCache:
+    """Bounded LRU cache whose entries also expire after `ttl` seconds.
+
+    Per process; callers invalidate explicitly when the source changes.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        CACHES[name] = self
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.get(key, _MISSING)
+        if entry is not _MISSING and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            counters.inc("cache_hits_total", cache=self.name)
+            return entry[1]
+        if entry is not _MISSING:
+            del self._entries[key]
+        counters.inc("cache_misses_total", cache=self.name)
+        return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        hits = counters.get("cache_hits_total", cache=self.name)
+        misses = counters.get("cache_misses_total", cache=self.name)
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": hits,
+            "misses": misses,
+            "hitRatio": ratio(hits, hits + misses),
+        }
+
+class ProfileCache(ABC):
+    """Encoded user profiles by user id, each with the document version it came from.
+
+    GET /api/users/{id} only talks to this interface, so a store shared by all
+    workers (e.g. Redis) can replace the per-process one. Readers take a
+    `generation()` before reading the database and pass it to `set()`; an
+    entry read before an `invalidate()` of its key is then dropped instead of
+    resurrecting the old profile.
+    """
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Tuple[int, bytes]]:
+        ...
+
+    @abstractmethod
+    def generation(self, key: str) -> int:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, version: int, body: bytes, generation: int):
+        ...
+
+    @abstractmethod
+    def invalidate(self, key: str):
+        ...
+
+    @abstractmethod
+    def stats(self) -> dict:
+        ...
+
+# Rough per-entry overhead (key, tuple, OrderedDict node) on top of the body
+ENTRY_OVERHEAD_BYTES = 200
+
+class MemoryProfileCache(ProfileCache):
+    """Per-process LRU bounded by the bytes it holds; entries also expire after `ttl`.
+
+    The expiry is only a backstop for writers that can't invalidate (scripts);
+    the app invalidates on every write to a user.
+    """
+
+    def __init__(self, name: str, max_bytes: int, ttl: float, max_tombstones: int = 100000):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_tombstones = max_tombstones
+        self.bytes = 0
+        self._entries: "OrderedDict[str, Tuple[float, int, bytes]]" = OrderedDict()
+        # Generation clock; keys invalidated at which generation; generations below the floor are stale
+        self._clock = 0
+        self._invalidated: Dict[str, int] = {}
+        self._floor = 0
+        CACHES[name] = self
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, key: str) -> Optional[Tuple[int, bytes]]:
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            counters.inc("cache_hits_total", cache=self.name)
+            return entry[1], entry[2]
+        if entry is not None:
+            self._drop(key)
+        counters.inc("cache_misses_total", cache=self.name)
+        return None
+
+    def generation(self, key: str) -> int:
+        return self._clock
+
+    async def set(self, key: str, version: int, body: bytes, generation: int):
+        if generation < self._floor or self._invalidated.get(key, -1) >= generation:
+            counters.inc("cache_stale_sets_total", cache=self.name)
+            return
+        size = len(body) + ENTRY_OVERHEAD_BYTES
+        if size > self.max_bytes:
+            return
+        self._drop(key)
+        self._entries[key] = (time.monotonic() + self.ttl, version, body)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+
+    def invalidate(self, key: str):
+        self._drop(key)
+        self._invalidated[key] = self._clock
+        self._clock += 1
+        if len(self._invalidated) > self.max_tombstones:
+            # Forget individual keys; every read started before now is stale instead
+            self._invalidated.clear()
+            self._floor = self._clock
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= len(entry[2]) + ENTRY_OVERHEAD_BYTES
+
+    def stats(self) -> dict:
+        hits = counters.get("cache_hits_total", cache=self.name)
+        misses = counters.get("cache_misses_total", cache=self.name)
+        return {
+            "size": len(self._entries),
+            "bytes": self.bytes,
+            "maxBytes": self.max_bytes,
+            "hits": hits,
+            "misses": misses,
+            "hitRatio": ratio(hits, hits + misses),
+            "staleSets": counters.get("cache_stale_sets_total", cache=self.name),
+        }
@@ -1,15 +1,7 @@
 
-import os
 import asyncio
-from motor.motor_asyncio import AsyncIOMotorClient
-from dotenv import load_dotenv
-from pathlib import Path
 
-ROOT_DIR = Path('/app/backend')
-load_dotenv(ROOT_DIR / '.env')
-
-MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-DB_NAME = os.environ.get('DB_NAME', 'aviato_db')
+from server import client, db, advance_clocks, conversations_clock, users_written_by_script
 
 ALLOWED_EMAILS = [
     "allenbrown530@gmail.com",
@@ -21,9 +13,6 @@ ALLOWED_EMAILS = [
 ]
 
 async def cleanup_all():
-    client = AsyncIOMotorClient(MONGO_URL)
-    db = client[DB_NAME]
-    
     print("Starting Universal Cleanup of Mock Users...")
     
     # 1. Identify users to delete
@@ -45,11 +34,16 @@ async def cleanup_all():
         
         # 3. Delete Conversations
         # Delete any conversation where ANY participant is in ids_to_delete
+        participants = await db.conversations.distinct("participants", {"participants": {"$in": ids_to_delete}})
         conv_result = await db.conversations.delete_many({
             "participants": {"$in": ids_to_delete}
         })
         print(f"Deleted {conv_result.deleted_count} conversations involving mock users.")
         
+        # Move the list ETags and drop the profiles cached by running workers
+        await advance_clocks(*[conversations_clock(user_id) for user_id in participants])
+        await users_written_by_script(ids_to_delete)
+        
     print("\nRemaining Real Users:")
     real_users = await db.users.find({}).to_list(1000)
     for u in real_users:
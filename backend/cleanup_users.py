@@ -1,20 +1,9 @@
 
-import os
 import asyncio
-from motor.motor_asyncio import AsyncIOMotorClient
-from dotenv import load_dotenv
-from pathlib import Path
 
-ROOT_DIR = Path('/app/backend')
-load_dotenv(ROOT_DIR / '.env')
-
-MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-DB_NAME = os.environ.get('DB_NAME', 'aviato_db')
+from server import client, db, conversation_written, users_written_by_script
 
 async def cleanup_users():
-    client = AsyncIOMotorClient(MONGO_URL)
-    db = client[DB_NAME]
-    
     print("Cleaning up demo users...")
     
     # Logic: Delete users where _id is "current-user" OR length is small (single digits)
@@ -29,6 +18,8 @@ async def cleanup_users():
     })
     
     print(f"Deleted {result.deleted_count} demo users.")
+    # Moves the GET /users ETag and drops the profiles cached by running workers
+    await users_written_by_script(demo_ids)
     
     # Also clean up conversations involving these users?
     # Ideally yes, but maybe not strictly required. Let's leave chats for now or they might break if one party is missing.
@@ -51,6 +42,7 @@ async def cleanup_users():
         participants = c.get("participants", [])
         if any(p not in valid_ids for p in participants):
             await db.conversations.delete_one({"_id": c["_id"]})
+            await conversation_written(participants)
             deleted_convs += 1
             
     print(f"Deleted {deleted_convs} orphaned conversations.")
@@ -0,0 +1,85 @@
+import asyncio
+import functools
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from cache import TTLCache
+from metrics import counters, ratio
+
+# Every single-flight group by name, for GET /stats
+FLIGHTS: Dict[str, "SingleFlight"] = {}
+
+_MISSING = object()
+
+class SingleFlight:
+    """Concurrent calls with the same key share one execution.
+
+    The first caller starts the work as its own task; callers arriving while it
+    runs await the same task, so one of them going away doesn't cancel it for
+    the rest. With a `ttl`, the result is also reused for that long after it
+    completes (a micro-cache); keep it sub-second unless the key already
+    changes whenever the result would.
+
+    Results are shared between callers and must not be mutated.
+    """
+
+    def __init__(self, name: str, ttl: float = 0.0, maxsize: int = 1024):
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self._recent: Optional[TTLCache] = TTLCache(f"{name}.recent", maxsize, ttl) if ttl > 0 else None
+        FLIGHTS[name] = self
+
+    async def run(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        if self._recent is not None:
+            value = self._recent.get(key, _MISSING)
+            if value is not _MISSING:
+                counters.inc("singleflight_calls_total", flight=self.name, outcome="cached")
+                return value
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._execute(key, fn))
+            self._inflight[key] = task
+            counters.inc("singleflight_calls_total", flight=self.name, outcome="executed")
+        else:
+            counters.inc("singleflight_calls_total", flight=self.name, outcome="shared")
+        return await asyncio.shield(task)
+
+    async def _execute(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            value = await fn()
+            if self._recent is not None:
+                self._recent.set(key, value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        executed = counters.get("singleflight_calls_total", flight=self.name, outcome="executed")
+        shared = counters.get("singleflight_calls_total", flight=self.name, outcome="shared")
+        cached = counters.get("singleflight_calls_total", flight=self.name, outcome="cached")
+        total = executed + shared + cached
+        return {
+            "calls": total,
+            "executed": executed,
+            "shared": shared,
+            "cached": cached,
+            "inFlight": len(self._inflight),
+            "coalescedRatio": ratio(shared + cached, total),
+        }
+
+def single_flight(name: str, ttl: float = 0.0, maxsize: int = 1024, key: Optional[Callable[..., Hashable]] = None):
+    """Decorator coalescing concurrent calls of an async function (see SingleFlight).
+
+    Calls coalesce when their arguments are equal, or when `key(*args, **kwargs)`
+    is; arguments must be hashable unless a `key` is given.
+    """
+    def decorate(fn):
+        flight = SingleFlight(name, ttl, maxsize)
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            k = key(*args, **kwargs) if key else (args, tuple(sorted(kwargs.items())))
+            return await flight.run(k, lambda: fn(*args, **kwargs))
+
+        wrapper.flight = flight
+        return wrapper
+    return decorate
@@ -0,0 +1,192 @@
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Callable, Optional, Set
+
+from bson import ObjectId
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+
+logger = logging.getLogger(__name__)
+
+# Every worker listens here; per-user events go to user_channel(user_id)
+BROADCAST_CHANNEL = "broadcast"
+# Worker-to-worker cache invalidations (never forwarded to sockets)
+INVALIDATION_CHANNEL = "invalidate"
+
+def user_channel(user_id: str) -> str:
+    return f"user:{user_id}"
+
+Handler = Callable[[str, str], None]
+
+class EventBus(ABC):
+    """Pub/sub between server processes.
+
+    Messages are already-serialized event strings. A worker subscribes only to
+    the channels of users connected to it (plus the broadcast and invalidation
+    channels) and gets
+    each message on its handler, including the ones it published itself.
+    """
+
+    def __init__(self):
+        self.handler: Optional[Handler] = None
+        self.channels: Set[str] = {BROADCAST_CHANNEL, INVALIDATION_CHANNEL}
+
+    def bind(self, handler: Handler):
+        self.handler = handler
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def subscribe(self, channel: str):
+        self.channels.add(channel)
+
+    async def unsubscribe(self, channel: str):
+        self.channels.discard(channel)
+
+    @abstractmethod
+    async def publish(self, channel: str, message: str):
+        ...
+
+    def _dispatch(self, channel: str, message: str):
+        if self.handler and channel in self.channels:
+            self.handler(channel, message)
+
+class MemoryEventBus(EventBus):
+    """Single process: publishing is delivering."""
+
+    async def publish(self, channel: str, message: str):
+        self._dispatch(channel, message)
+
+class MongoEventBus(EventBus):
+    """Fan-out through a capped collection that every worker tails.
+
+    Needs nothing besides the MongoDB the app already uses. Each worker reads
+    the whole stream and drops channels it isn't subscribed to, so this suits
+    moderate event rates; use Redis beyond that.
+    """
+
+    # On a tail restart, re-read this far back (ObjectIds from different
+    # processes aren't strictly ordered) and skip what was already seen
+    RESUME_OVERLAP = timedelta(seconds=2)
+    SEEN_LIMIT = 4096
+
+    def __init__(self, db, collection: str = "events", size_bytes: int = 16 * 1024 * 1024, retry_seconds: float = 0.5):
+        super().__init__()
+        self.db = db
+        self.collection_name = collection
+        self.size_bytes = size_bytes
+        self.retry_seconds = retry_seconds
+        self._seen: "OrderedDict[ObjectId, None]" = OrderedDict()
+        self._resume_from: Optional[ObjectId] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def collection(self):
+        return self.db[self.collection_name]
+
+    async def start(self):
+        try:
+            await self.db.create_collection(self.collection_name, capped=True, size=self.size_bytes)
+        except CollectionInvalid:
+            pass  # Already there
+        # Only events published from now on
+        self._resume_from = ObjectId()
+        self._task = asyncio.ensure_future(self._tail())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    async def publish(self, channel: str, message: str):
+        await self.collection.insert_one({"channel": channel, "message": message})
+
+    async def _tail(self):
+        while True:
+            since = ObjectId.from_datetime(self._resume_from.generation_time - self.RESUME_OVERLAP)
+            cursor = self.collection.find({"_id": {"$gte": since}}, cursor_type=CursorType.TAILABLE_AWAIT)
+            try:
+                while cursor.alive:
+                    async for doc in cursor:
+                        self._receive(doc)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Event tail on {self.collection_name} failed, reopening: {e}")
+            # A tailable cursor on an empty capped collection dies at once; reopen after a pause
+            await asyncio.sleep(self.retry_seconds)
+
+    def _receive(self, doc: dict):
+        if doc["_id"] in self._seen:
+            return
+        self._seen[doc["_id"]] = None
+        if len(self._seen) > self.SEEN_LIMIT:
+            self._seen.popitem(last=False)
+        self._resume_from = doc["_id"]
+        self._dispatch(doc["channel"], doc["message"])
+
+class RedisEventBus(EventBus):
+    """Redis PUBLISH/SUBSCRIBE; works against any server speaking the Redis protocol."""
+
+    def __init__(self, url: str, poll_seconds: float = 1.0):
+        super().__init__()
+        try:
+            import redis.asyncio as aioredis
+        except ImportError:
+            raise RuntimeError("EVENT_BUS=redis needs the 'redis' package (pip install redis)")
+        self.redis = aioredis.from_url(url)
+        self.pubsub = self.redis.pubsub()
+        self.poll_seconds = poll_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        await self.pubsub.subscribe(*self.channels)
+        self._task = asyncio.ensure_future(self._listen())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+        await self.pubsub.aclose()
+        await self.redis.aclose()
+
+    async def subscribe(self, channel: str):
+        await super().subscribe(channel)
+        await self.pubsub.subscribe(channel)
+
+    async def unsubscribe(self, channel: str):
+        await super().unsubscribe(channel)
+        await self.pubsub.unsubscribe(channel)
+
+    async def publish(self, channel: str, message: str):
+        await self.redis.publish(channel, message)
+
+    async def _listen(self):
+        while True:
+            try:
+                msg = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=self.poll_seconds)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Redis event listener error: {e}")
+                await asyncio.sleep(self.poll_seconds)
+                continue
+            if msg and msg["type"] == "message":
+                channel = msg["channel"].decode() if isinstance(msg["channel"], bytes) else msg["channel"]
+                data = msg["data"].decode() if isinstance(msg["data"], bytes) else msg["data"]
+                self._dispatch(channel, data)
+
+def create_event_bus(kind: str, db=None, redis_url: Optional[str] = None) -> EventBus:
+    """Bus selected by the EVENT_BUS setting: memory (default), mongo or redis."""
+    kind = (kind or "memory").lower()
+    if kind == "memory":
+        return MemoryEventBus()
+    if kind == "mongo":
+        return MongoEventBus(db)
+    if kind == "redis":
+        return RedisEventBus(redis_url or "redis://localhost:6379/0")
+    raise ValueError(f"Unknown EVENT_BUS '{kind}' (expected memory, mongo or redis)")
@@ -0,0 +1,40 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from metrics import counters
+
+class Saturated(RuntimeError):
+    """Raised instead of queueing when a BoundedExecutor's backlog is full."""
+
+class BoundedExecutor:
+    """A small thread pool for blocking work with a cap on how much may wait for it.
+
+    Beyond `queue_limit` jobs waiting for a free thread, `run` fails fast with
+    Saturated rather than letting latency grow without bound.
+    """
+
+    def __init__(self, name: str, workers: int, queue_limit: int):
+        self.name = name
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self.in_flight = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """Jobs accepted but not yet running."""
+        return max(0, self.in_flight - self.workers)
+
+    async def run(self, fn: Callable[..., Any], *args) -> Any:
+        if self.queue_depth >= self.queue_limit:
+            counters.inc("executor_rejected_total", executor=self.name)
+            raise Saturated(f"{self.name} executor saturated")
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self.in_flight -= 1
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
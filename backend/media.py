@@ -0,0 +1,190 @@
+import io
+import base64
+import asyncio
+import hashlib
+import logging
+from concurrent.futures import Executor
+from typing import Dict, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+from pymongo.errors import DuplicateKeyError
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Thumbnails are optional; originals are served without Pillow
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Served by GET /api/media/{digest}; user documents store this short reference
+MEDIA_URL_PREFIX = "/api/media/"
+MAX_MEDIA_BYTES = 5 * 1024 * 1024  # Same limit the upload dialog enforces
+# Square avatar variants (px) served via GET /api/media/{digest}?size=
+THUMBNAIL_SIZES = (48, 128, 512)
+# Raster formats accepted for upload, recognised by their leading bytes. The
+# type the client declares is never trusted: SVG or HTML served from the API's
+# own origin would run scripts.
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+SAFE_CONTENT_TYPES = {"image/jpeg", "image/png", "image/gif", "image/webp"}
+
+class MediaError(ValueError):
+    pass
+
+def media_ref(digest: str) -> str:
+    return MEDIA_URL_PREFIX + digest
+
+def is_data_url(value: Optional[str]) -> bool:
+    return bool(value) and value.startswith("data:")
+
+def parse_data_url(value: str) -> Tuple[bytes, str]:
+    """Decode a base64 `data:image/...;base64,...` URL into (bytes, content type)."""
+    try:
+        header, payload = value[len("data:"):].split(",", 1)
+    except ValueError:
+        raise MediaError("Malformed data URL")
+    parts = header.split(";")
+    content_type = parts[0] or "application/octet-stream"
+    if "base64" not in parts[1:]:
+        raise MediaError("Only base64 data URLs are supported")
+    try:
+        data = base64.b64decode(payload, validate=True)
+    except ValueError:
+        raise MediaError("Malformed data URL")
+    return data, content_type
+
+def sniff_image_type(data: bytes) -> Optional[str]:
+    """Content type of an accepted raster image, from its bytes; None for anything else."""
+    for signature, content_type in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return content_type
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+def render_thumbnail(data: bytes, size: int) -> Tuple[bytes, str]:
+    """Decode an image, center-crop it to a square of at most `size` px and re-encode it.
+
+    CPU-bound; runs in a worker process (see MediaStore.get_variant).
+    """
+    with Image.open(io.BytesIO(data)) as img:
+        img = ImageOps.exif_transpose(img)
+        edge = min(size, img.width, img.height)  # Never upscale
+        img = ImageOps.fit(img, (edge, edge), Image.LANCZOS)
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "transparency" in img.info or img.mode in ("LA", "PA") else "RGB")
+        out = io.BytesIO()
+        try:
+            img.save(out, "WEBP", quality=80, method=4)
+            return out.getvalue(), "image/webp"
+        except (KeyError, OSError):  # Pillow built without WebP
+            out = io.BytesIO()
+            img.convert("RGB").save(out, "JPEG", quality=85, optimize=True)
+            return out.getvalue(), "image/jpeg"
+
+class MediaStore:
+    """Content-addressed image store on GridFS.
+
+    Blobs are keyed by the SHA-256 of their bytes, so identical uploads are
+    stored once and a digest never changes content (safe to cache forever).
+    """
+
+    def __init__(self, db, bucket_name: str = "media"):
+        self.db = db
+        self.bucket_name = bucket_name
+        self.bucket = AsyncIOMotorGridFSBucket(db, bucket_name=bucket_name)
+        # Derivatives being rendered right now, so concurrent requests share one job
+        self._rendering: Dict[str, asyncio.Future] = {}
+
+    @property
+    def files(self):
+        return self.db[f"{self.bucket_name}.files"]
+
+    @property
+    def failed_variants(self):
+        """Markers of thumbnails that failed to render, so each is only attempted once."""
+        return self.db[f"{self.bucket_name}.failed_variants"]
+
+    async def put(self, data: bytes) -> str:
+        if len(data) > MAX_MEDIA_BYTES:
+            raise MediaError("File size too large (max 5MB)")
+        content_type = sniff_image_type(data)
+        if content_type is None:
+            raise MediaError("Only JPEG, PNG, GIF and WebP images can be uploaded")
+
+        digest = hashlib.sha256(data).hexdigest()
+        if await self.files.find_one({"_id": digest}, {"_id": 1}):
+            return digest
+        try:
+            await self.bucket.upload_from_stream_with_id(
+                digest, digest, data, metadata={"contentType": content_type}
+            )
+        except DuplicateKeyError:
+            pass  # Same content uploaded concurrently
+        return digest
+
+    async def put_data_url(self, value: str) -> str:
+        data, _ = parse_data_url(value)
+        return await self.put(data)
+
+    async def get(self, digest: str) -> Optional[Tuple[bytes, str]]:
+        info = await self.files.find_one({"_id": digest}, {"metadata": 1})
+        if not info:
+            return None
+        stream = await self.bucket.open_download_stream(digest)
+        data = await stream.read()
+        content_type = (info.get("metadata") or {}).get("contentType", "application/octet-stream")
+        return data, content_type
+
+    async def get_variant(self, digest: str, size: int, executor: Optional[Executor]) -> Optional[Tuple[bytes, str]]:
+        """Return the `size` px thumbnail of a blob, rendering and caching it on first use.
+
+        None when there is no thumbnail to serve: no such blob, Pillow or the
+        pool unavailable, a non-raster original, or a render that failed
+        before (recorded, so a bad image isn't decoded again on every request).
+        """
+        variant_id = f"{digest}-{size}"
+        cached = await self.get(variant_id)
+        if cached:
+            return cached
+        if Image is None or executor is None:
+            return None
+        if await self.failed_variants.find_one({"_id": variant_id}, {"_id": 1}):
+            return None
+
+        original = await self.get(digest)
+        if not original or original[1] not in SAFE_CONTENT_TYPES:
+            return None
+
+        pending = self._rendering.get(variant_id)
+        if pending is None:
+            pending = asyncio.ensure_future(self._render_variant(digest, size, original, executor))
+            self._rendering[variant_id] = pending
+            pending.add_done_callback(lambda _: self._rendering.pop(variant_id, None))
+        return await asyncio.shield(pending)
+
+    async def _render_variant(self, digest: str, size: int, original: Tuple[bytes, str], executor: Executor):
+        variant_id = f"{digest}-{size}"
+        loop = asyncio.get_running_loop()
+        try:
+            thumb, thumb_type = await loop.run_in_executor(executor, render_thumbnail, original[0], size)
+        except Exception as e:
+            logger.warning(f"Thumbnail {variant_id} failed, not retrying: {e}")
+            try:
+                await self.failed_variants.insert_one({"_id": variant_id, "source": digest, "size": size, "error": str(e)[:500]})
+            except DuplicateKeyError:
+                pass  # Failed concurrently on another worker
+            return None
+
+        try:
+            await self.bucket.upload_from_stream_with_id(
+                variant_id, variant_id, thumb,
+                metadata={"contentType": thumb_type, "source": digest, "size": size}
+            )
+        except DuplicateKeyError:
+            pass  # Rendered concurrently by another worker
+        return thumb, thumb_type
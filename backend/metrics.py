@@ -0,0 +1,133 @@
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Callable, Dict, Iterator, Tuple, Union
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+class Counters:
+    """In-process counters, keyed by name and labels (per worker)."""
+
+    def __init__(self):
+        self._values: Dict[str, Dict[LabelKey, float]] = defaultdict(lambda: defaultdict(int))
+
+    def inc(self, name: str, amount: float = 1, **labels: str):
+        self._values[name][tuple(sorted(labels.items()))] += amount
+
+    def get(self, name: str, **labels: str) -> float:
+        return self._values.get(name, {}).get(tuple(sorted(labels.items())), 0)
+
+    def by_label(self, name: str, label: str) -> Dict[str, float]:
+        """Totals of one counter grouped by one of its labels."""
+        totals: Dict[str, float] = defaultdict(int)
+        for key, value in self._values.get(name, {}).items():
+            totals[dict(key).get(label, "")] += value
+        return dict(totals)
+
+    def series(self):
+        """(name, {label key: value}) for every counter."""
+        return self._values.items()
+
+    def reset(self):
+        self._values.clear()
+
+counters = Counters()
+
+def ratio(part: float, whole: float) -> float:
+    return round(part / whole, 4) if whole else 0.0
+
+# Seconds; from a fast cache hit up to a request stuck behind bcrypt
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense, keyed by labels."""
+
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [count per bucket (+Inf last), sum]
+        self._values: Dict[LabelKey, list] = {}
+        HISTOGRAMS[name] = self
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(sorted(labels.items()))
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def count(self, **labels: str) -> int:
+        entry = self._values.get(tuple(sorted(labels.items())))
+        return sum(entry[0]) if entry else 0
+
+    def samples(self) -> Iterator[Tuple[str, LabelKey, float]]:
+        for key, (counts, total) in self._values.items():
+            running = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                running += n
+                yield f"{self.name}_bucket", key + (("le", format_bound(bound)),), running
+            yield f"{self.name}_sum", key, total
+            yield f"{self.name}_count", key, running
+
+    def reset(self):
+        self._values.clear()
+
+class Gauges:
+    """Values read when /metrics is scraped, so nothing is tracked on the hot path."""
+
+    def __init__(self):
+        self._gauges: Dict[str, Tuple[str, Callable[[], Union[float, Dict[LabelKey, float]]]]] = {}
+
+    def register(self, name: str, help: str, read: Callable[[], Union[float, Dict[LabelKey, float]]]):
+        """`read` returns a number, or {label key: number} for a labelled gauge."""
+        self._gauges[name] = (help, read)
+
+    def items(self):
+        return self._gauges.items()
+
+HISTOGRAMS: Dict[str, Histogram] = {}
+gauges = Gauges()
+
+# Counter help texts for /metrics; counters without one are still exported
+COUNTER_HELP = {
+    "http_requests_total": "HTTP requests by route, method and status.",
+    "etag_requests_total": "Conditional GET candidates by route.",
+    "etag_not_modified_total": "Requests answered 304 by route.",
+    "cache_hits_total": "In-process cache hits.",
+    "cache_misses_total": "In-process cache misses.",
+    "executor_rejected_total": "Jobs refused by a saturated executor.",
+    "db_commands_total": "Mongo commands issued by requests, per route.",
+    "db_time_seconds_total": "Time spent in Mongo commands by requests, per route.",
+    "long_poll_total": "GET /updates outcomes: changed (answered at once), woken, timeout.",
+}
+
+def format_bound(bound: float) -> str:
+    return "+Inf" if bound == float("inf") else repr(bound)
+
+def escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def format_labels(key: LabelKey) -> str:
+    if not key:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label_value(value)}"' for name, value in key) + "}"
+
+def render_prometheus() -> str:
+    """Every counter, histogram and gauge of this process in Prometheus text format 0.0.4."""
+    lines = []
+    for name, series in sorted(counters.series()):
+        lines.append(f"# HELP {name} {COUNTER_HELP.get(name, name.replace('_', ' '))}")
+        lines.append(f"# TYPE {name} counter")
+        lines += [f"{name}{format_labels(key)} {value}" for key, value in series.items()]
+    for name, histogram in sorted(HISTOGRAMS.items()):
+        lines.append(f"# HELP {name} {histogram.help}")
+        lines.append(f"# TYPE {name} histogram")
+        lines += [f"{sample}{format_labels(key)} {value}" for sample, key, value in histogram.samples()]
+    for name, (help, read) in sorted(gauges.items()):
+        value = read()
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} gauge")
+        series = value.items() if isinstance(value, dict) else [((), value)]
+        lines += [f"{name}{format_labels(key)} {v}" for key, v in series]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,37 @@
+
+import asyncio
+import argparse
+
+from server import client, db, move_embedded_messages
+
+async def migrate_messages(batch_size: int, pause: float):
+    """Move embedded conversations.messages arrays into the messages collection.
+
+    Runs online against a live database: conversations are processed in small
+    batches with a pause in between, each move is idempotent, and the API
+    moves any conversation it reads history for on its own.
+    """
+    print("Migrating embedded messages...")
+    
+    conversations = 0
+    messages = 0
+    while True:
+        batch = await db.conversations.find({"messages": {"$exists": True}}).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+        for conv in batch:
+            messages += await move_embedded_messages(conv)
+            conversations += 1
+        print(f"  {conversations} conversations, {messages} messages moved")
+        await asyncio.sleep(pause)
+    
+    print(f"Migration complete. Moved {messages} messages from {conversations} conversations.")
+    
+    client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=migrate_messages.__doc__.splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--pause", type=float, default=0.2, help="Seconds to wait between batches")
+    args = parser.parse_args()
+    asyncio.run(migrate_messages(args.batch_size, args.pause))
@@ -0,0 +1,60 @@
+
+import asyncio
+
+from media import MediaError, media_ref, is_data_url
+from server import client, db, media, with_version, users_written_by_script
+
+async def migrate_profile_pics():
+    """Move base64 profile pictures out of user documents into the media store.
+
+    Rewrites users.profilePic, every embedded reviews[].raterProfilePic and
+    every reviews.raterProfilePic that still holds a data URL to its
+    /api/media/<sha256> reference. Safe to re-run.
+    """
+    print("Migrating profile pictures to the media store...")
+    
+    moved = []
+    cursor = db.users.find(
+        {"$or": [{"profilePic": {"$regex": "^data:"}}, {"reviews.raterProfilePic": {"$regex": "^data:"}}]},
+        {"name": 1, "profilePic": 1, "reviews": 1}
+    )
+    async for u in cursor:
+        updates = {}
+        try:
+            if is_data_url(u.get('profilePic')):
+                updates['profilePic'] = media_ref(await media.put_data_url(u['profilePic']))
+            
+            reviews = u.get('reviews') or []
+            for i, r in enumerate(reviews):
+                if is_data_url(r.get('raterProfilePic')):
+                    updates[f'reviews.{i}.raterProfilePic'] = media_ref(await media.put_data_url(r['raterProfilePic']))
+        except MediaError as e:
+            print(f"User {u.get('name')}: skipped ({e})")
+            continue
+        
+        if updates:
+            await db.users.update_one({"_id": u['_id']}, with_version({"$set": updates}))
+            moved.append(u['_id'])
+            print(f"User {u.get('name')}: moved {len(updates)} picture(s)")
+    
+    if moved:
+        await users_written_by_script(moved)
+    
+    rewritten = 0
+    cursor = db.reviews.find({"raterProfilePic": {"$regex": "^data:"}}, {"raterProfilePic": 1})
+    async for r in cursor:
+        try:
+            ref = media_ref(await media.put_data_url(r['raterProfilePic']))
+        except MediaError as e:
+            print(f"Review {r['_id']}: skipped ({e})")
+            continue
+        # Only if it still holds the picture read above (the rater may have reviewed again since)
+        await db.reviews.update_one({"_id": r['_id'], "raterProfilePic": r['raterProfilePic']}, {"$set": {"raterProfilePic": ref}})
+        rewritten += 1
+    
+    print(f"Migration complete. Updated {len(moved)} users and {rewritten} reviews.")
+    
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(migrate_profile_pics())
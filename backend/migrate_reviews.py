@@ -0,0 +1,36 @@
+import asyncio
+import argparse
+
+from server import client, db, move_embedded_reviews
+
+async def migrate_reviews(batch_size: int, pause: float):
+    """Move embedded users.reviews arrays into the reviews collection.
+
+    Runs online against a live database: users are processed in small
+    batches with a pause in between, each move is idempotent, and the API
+    moves any user it reads or writes reviews of on its own.
+    """
+    print("Migrating embedded reviews...")
+    
+    users = 0
+    reviews = 0
+    while True:
+        batch = await db.users.find({"reviews": {"$exists": True}}, {"reviews": 1}).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+        for user in batch:
+            reviews += await move_embedded_reviews(user)
+            users += 1
+        print(f"  {users} users, {reviews} reviews moved")
+        await asyncio.sleep(pause)
+    
+    print(f"Migration complete. Moved {reviews} reviews from {users} users.")
+    
+    client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=migrate_reviews.__doc__.splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--pause", type=float, default=0.2, help="Seconds to wait between batches")
+    args = parser.parse_args()
+    asyncio.run(migrate_reviews(args.batch_size, args.pause))
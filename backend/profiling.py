@@ -0,0 +1,145 @@
+"""Opt-in profiling of single requests, for triage on production data.
+
+A request carrying a valid `X-Profile` token is run under a profiler and the
+result is written to PROFILE_DIR; the response names the file in
+`X-Profile-Id`, and GET /api/admin/profiles/{id} serves it back.
+
+Tokens are `<expiry unix time>.<hex HMAC-SHA256 of the expiry>` under
+PROFILE_SECRET, so only whoever holds the secret can mint them; without a
+secret the feature is off. Mint one with:
+
+    PROFILE_SECRET=... python profiling.py [minutes]
+"""
+
+import io
+import os
+import re
+import sys
+import hmac
+import time
+import pstats
+import hashlib
+import logging
+import cProfile
+from pathlib import Path
+from typing import List, Optional
+
+try:
+    from pyinstrument import Profiler
+except ImportError:  # Optional; falls back to cProfile
+    Profiler = None
+
+from tracing import current_trace
+
+logger = logging.getLogger(__name__)
+
+PROFILE_ID_PATTERN = re.compile(r"^[0-9]+-[A-Za-z0-9_-]+\.(html|txt)$")
+
+def sign(expires: int, secret: str) -> str:
+    return hmac.new(secret.encode(), str(expires).encode(), hashlib.sha256).hexdigest()
+
+def make_token(secret: str, minutes: float = 15) -> str:
+    expires = int(time.time() + minutes * 60)
+    return f"{expires}.{sign(expires, secret)}"
+
+def verify_token(token: Optional[str], secret: str) -> bool:
+    if not secret or not token:
+        return False
+    expires, _, signature = token.partition(".")
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    return hmac.compare_digest(signature, sign(int(expires), secret))
+
+def list_profiles(directory: Path) -> List[dict]:
+    """Saved profiles, newest first."""
+    if not directory.is_dir():
+        return []
+    files = sorted((p for p in directory.iterdir() if PROFILE_ID_PATTERN.match(p.name)), reverse=True)
+    return [{"id": p.name, "bytes": p.stat().st_size} for p in files]
+
+def profile_path(directory: Path, profile_id: str) -> Optional[Path]:
+    """The file of a profile id, or None; ids never reach outside `directory`."""
+    if not PROFILE_ID_PATTERN.match(profile_id):
+        return None
+    path = directory / profile_id
+    return path if path.is_file() else None
+
+class ProfilingMiddleware:
+    """ASGI middleware running requests with a valid X-Profile token under a profiler.
+
+    pyinstrument (when installed) samples only the request's own task and
+    writes HTML. The cProfile fallback is deterministic, writes a text report,
+    and sees whatever else the event loop runs meanwhile; since cProfile
+    allows one active profiler per process, a second concurrent profiled
+    request is served unprofiled.
+    """
+
+    def __init__(self, app, secret: str, directory: Path, keep: int = 50):
+        self.app = app
+        self.secret = secret
+        self.directory = directory
+        self.keep = keep
+        self._cprofile_busy = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.secret:
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or [])
+        token = headers.get(b"x-profile", b"").decode("latin-1")
+        if not token:
+            await self.app(scope, receive, send)
+            return
+        if not verify_token(token, self.secret):
+            logger.warning(f"Ignoring invalid X-Profile token on {scope['method']} {scope['path']}")
+            await self.app(scope, receive, send)
+            return
+        if Profiler is None and self._cprofile_busy:
+            logger.warning(f"Not profiling {scope['method']} {scope['path']}: another profile is running")
+            await self.app(scope, receive, send)
+            return
+
+        trace = current_trace()
+        label = re.sub(r"[^A-Za-z0-9_-]", "", trace.request_id if trace else "")[:40] or str(int(time.time() * 1000))
+        profile_id = f"{int(time.time())}-{label}.{'html' if Profiler else 'txt'}"
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        if Profiler is not None:
+            profiler = Profiler(async_mode="enabled")
+            profiler.start()
+            try:
+                await self.app(scope, receive, send_with_id)
+            finally:
+                profiler.stop()
+                self.save(profile_id, profiler.output_html())
+            return
+
+        self._cprofile_busy = True
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profiler.disable()
+            self._cprofile_busy = False
+            report = io.StringIO()
+            report.write(f"{scope['method']} {scope['path']}?{scope.get('query_string', b'').decode('latin-1')}\n\n")
+            pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(80)
+            self.save(profile_id, report.getvalue())
+
+    def save(self, profile_id: str, content: str):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        (self.directory / profile_id).write_text(content)
+        for stale in list_profiles(self.directory)[self.keep:]:
+            (self.directory / stale["id"]).unlink(missing_ok=True)
+        logger.info(f"Saved profile {profile_id}")
+
+if __name__ == "__main__":
+    secret = os.environ.get('PROFILE_SECRET', '')
+    if not secret:
+        sys.exit("PROFILE_SECRET is not set")
+    print(make_token(secret, float(sys.argv[1]) if len(sys.argv) > 1 else 15))
@@ -0,0 +1,381 @@
+import json
+import uuid
+import random
+import asyncio
+import logging
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from starlette.websockets import WebSocket
+
+from events import EventBus, MemoryEventBus, BROADCAST_CHANNEL, INVALIDATION_CHANNEL, user_channel
+
+logger = logging.getLogger(__name__)
+
+# An idle connection only wakes up this often, to keep proxies from closing it
+HEARTBEAT_SECONDS = 25
+# Events buffered per connection before it is considered stuck and dropped
+SEND_QUEUE_SIZE = 256
+# Close code for dropped slow consumers: reconnect (and refetch) later
+WS_1013_TRY_AGAIN_LATER = 1013
+# Events kept per user (and for broadcasts) so a reconnecting event stream can resume
+REPLAY_SIZE = 100
+# How long a user's channel stays subscribed, recording for replay, after their last stream closes
+REPLAY_GRACE_SECONDS = 60
+# EventSource reconnect delay we ask browsers for
+STREAM_RETRY_MS = 3000
+# A broadcast (any user's profile or mode change) concerns every parked long-poll,
+# and each woken one re-syncs against the database. Broadcasts are batched over
+# PARKED_BATCH_SECONDS and the wake-ups spread at random over PARKED_SPREAD_SECONDS,
+# so one profile edit doesn't answer thousands of parked requests in the same instant.
+PARKED_BATCH_SECONDS = 0.25
+PARKED_SPREAD_SECONDS = 1.0
+
+PING = json.dumps({"type": "ping"})
+
+class Connection:
+    """One open socket (or event stream, with no websocket) of a user, with its own bounded send queue."""
+
+    def __init__(self, websocket: Optional[WebSocket], user_id: str, queue_size: int = SEND_QUEUE_SIZE):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.queue_size = queue_size
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.overflowed = False
+
+    def offer(self, message: Any):
+        if self.overflowed:
+            return
+        if self.queue.qsize() >= self.queue_size:
+            # The client stopped reading; don't buffer for it without bound.
+            # It reconnects and refetches, which is cheaper than replaying.
+            self.overflowed = True
+            self.queue.put_nowait(None)
+            return
+        self.queue.put_nowait(message)
+
+class ReplayLog:
+    """The last events of one channel with their sequence numbers.
+
+    `floor` is the newest sequence number it can't replay from: events up to
+    it were evicted (or happened before the log existed).
+    """
+
+    __slots__ = ("events", "floor")
+
+    def __init__(self, size: int, floor: int):
+        self.events: deque = deque(maxlen=size)
+        self.floor = floor
+
+    def append(self, seq: int, message: str):
+        if len(self.events) == self.events.maxlen:
+            self.floor = self.events[0][0]
+        self.events.append((seq, message))
+
+    def since(self, seq: int) -> Optional[List[Tuple[int, str]]]:
+        """Events after `seq`, or None when some of them are gone."""
+        if seq < self.floor:
+            return None
+        return [(s, m) for s, m in self.events if s > seq]
+
+def sse_event(event_id: str, message: str) -> str:
+    # encode_event's JSON has no newlines, so it fits one data: line
+    return f"id: {event_id}\ndata: {message}\n\n"
+
+class Parked:
+    """The long-poll requests of one user waiting for that user's next event.
+
+    They share one Event, swapped for a fresh one on every wake-up, so a parked
+    request costs its own coroutine and nothing per event.
+    """
+
+    __slots__ = ("count", "event")
+
+    def __init__(self):
+        self.count = 0
+        self.event = asyncio.Event()
+
+    def wake(self):
+        self.event.set()
+        self.event = asyncio.Event()
+
+def encode_event(event_type: str, data: dict) -> str:
+    return json.dumps({"type": event_type, "data": data}, default=str)
+
+class Hub:
+    """Delivery of server events to connected sockets.
+
+    Events go out through an EventBus, so a user connected to another worker
+    gets them too; this process subscribes only to the users connected here.
+    """
+
+    def __init__(
+        self,
+        bus: Optional[EventBus] = None,
+        heartbeat: float = HEARTBEAT_SECONDS,
+        queue_size: int = SEND_QUEUE_SIZE,
+        replay_size: int = REPLAY_SIZE,
+        replay_grace: float = REPLAY_GRACE_SECONDS,
+        parked_batch: float = PARKED_BATCH_SECONDS,
+        parked_spread: float = PARKED_SPREAD_SECONDS,
+    ):
+        self.heartbeat = heartbeat
+        self.parked_batch = parked_batch
+        self.parked_spread = parked_spread
+        self._broadcast_wake: Optional[asyncio.TimerHandle] = None
+        self.queue_size = queue_size
+        self.replay_size = replay_size
+        self.replay_grace = replay_grace
+        self._connections: Dict[str, Set[Connection]] = defaultdict(set)
+        self._streams: Dict[str, Set[Connection]] = defaultdict(set)
+        self._parked: Dict[str, Parked] = {}
+        # Sockets + streams (and their grace periods) + parked requests per user;
+        # the user's channel is subscribed while > 0
+        self._listeners: Dict[str, int] = defaultdict(int)
+        # Event ids are "<epoch>-<seq>": seq counts the events this process
+        # dispatched, and ids from another process (or before a restart) don't resume
+        self.epoch = uuid.uuid4().hex[:8]
+        self._seq = 0
+        self._replay: Dict[str, ReplayLog] = {}
+        self._broadcast_replay = ReplayLog(replay_size, 0)
+        self._invalidation_handlers: Dict[str, Callable[[str], None]] = {}
+        self.use(bus or MemoryEventBus())
+
+    def use(self, bus: EventBus):
+        """Switch buses; only before any socket is connected."""
+        self.bus = bus
+        bus.bind(self._dispatch)
+
+    @property
+    def connection_count(self) -> int:
+        return sum(len(conns) for conns in self._connections.values())
+
+    @property
+    def parked_count(self) -> int:
+        return sum(parked.count for parked in self._parked.values())
+
+    @property
+    def stream_count(self) -> int:
+        return sum(len(streams) for streams in self._streams.values())
+
+    async def _retain(self, user_id: str):
+        self._listeners[user_id] += 1
+        if self._listeners[user_id] == 1:
+            try:
+                await self.bus.subscribe(user_channel(user_id))
+            except BaseException:
+                self._listeners[user_id] -= 1
+                if not self._listeners[user_id]:
+                    del self._listeners[user_id]
+                raise
+
+    async def _release(self, user_id: str):
+        self._listeners[user_id] -= 1
+        if not self._listeners[user_id]:
+            del self._listeners[user_id]
+            # Unsubscribed, the log would miss events; a later resume has to resync
+            self._replay.pop(user_id, None)
+            await self.bus.unsubscribe(user_channel(user_id))
+
+    async def publish(self, user_ids: Iterable[str], event_type: str, data: dict):
+        # Serialized once, however many sockets it goes to
+        message = encode_event(event_type, data)
+        for uid in set(user_ids):
+            await self.bus.publish(user_channel(uid), message)
+
+    async def broadcast(self, event_type: str, data: dict):
+        await self.bus.publish(BROADCAST_CHANNEL, encode_event(event_type, data))
+
+    def on_invalidate(self, kind: str, handler: Callable[[str], None]):
+        self._invalidation_handlers[kind] = handler
+
+    async def invalidate(self, kind: str, key: str):
+        """Have every worker (this one included) drop `key` from its `kind` cache."""
+        await self.bus.publish(INVALIDATION_CHANNEL, json.dumps({"kind": kind, "key": key}))
+
+    def _dispatch(self, channel: str, message: str):
+        if channel == INVALIDATION_CHANNEL:
+            invalidation = json.loads(message)
+            handler = self._invalidation_handlers.get(invalidation["kind"])
+            if handler:
+                handler(invalidation["key"])
+            return
+        self._seq += 1
+        seq = self._seq
+        if channel == BROADCAST_CHANNEL:
+            self._broadcast_replay.append(seq, message)
+            targets = [conn for conns in self._connections.values() for conn in conns]
+            streams = [stream for user_streams in self._streams.values() for stream in user_streams]
+            parked = []
+            self._schedule_broadcast_wake()
+        else:
+            user_id = channel[len(user_channel("")):]
+            replay = self._replay.get(user_id)
+            if replay is not None:
+                replay.append(seq, message)
+            targets = self._connections.get(user_id, ())
+            streams = self._streams.get(user_id, ())
+            parked = [self._parked[user_id]] if user_id in self._parked else []
+        for conn in targets:
+            conn.offer(message)
+        for stream in streams:
+            stream.offer((seq, message))
+        for p in parked:
+            p.wake()
+
+    def _schedule_broadcast_wake(self):
+        if self._broadcast_wake is None and self._parked:
+            self._broadcast_wake = asyncio.get_running_loop().call_later(self.parked_batch, self._wake_all_parked)
+
+    def _wake_all_parked(self):
+        self._broadcast_wake = None
+        loop = asyncio.get_running_loop()
+        for parked in self._parked.values():
+            loop.call_later(random.uniform(0, self.parked_spread), parked.wake)
+
+    def event_id(self, seq: int) -> str:
+        return f"{self.epoch}-{seq}"
+
+    def _missed(self, user_id: str, last_event_id: Optional[str]) -> Optional[List[Tuple[int, str]]]:
+        """The user's events after `last_event_id`, or None if they can't all be replayed."""
+        epoch, _, seq = (last_event_id or "").partition("-")
+        replay = self._replay.get(user_id)
+        if epoch != self.epoch or not seq.isdigit() or replay is None:
+            return None
+        own, broadcasts = replay.since(int(seq)), self._broadcast_replay.since(int(seq))
+        if own is None or broadcasts is None:
+            return None
+        return sorted(own + broadcasts)
+
+    async def stream(self, user_id: str, last_event_id: Optional[str] = None) -> AsyncIterator[str]:
+        """The user's events as text/event-stream chunks, until the client goes away.
+
+        With a `last_event_id` this process can still replay from, the missed
+        events come first; otherwise a `resync` event tells the client to
+        catch up through GET /api/sync. A fresh stream starts with `ready`,
+        whose id makes its first reconnect resumable.
+        """
+        conn = Connection(None, user_id, self.queue_size)
+        await self._retain(user_id)
+        try:
+            # No await from here on: later events queue up on conn. The replay is
+            # computed before a missing log is created, so that a resume whose log
+            # expired (the channel went unsubscribed) resyncs instead of replaying nothing.
+            self._streams[user_id].add(conn)
+            missed = self._missed(user_id, last_event_id) if last_event_id else []
+            if user_id not in self._replay:
+                self._replay[user_id] = ReplayLog(self.replay_size, self._seq)
+            current = self.event_id(self._seq)
+            yield f"retry: {STREAM_RETRY_MS}\n\n"
+            if missed is None:
+                yield sse_event(current, encode_event("resync", {}))
+            elif not last_event_id:
+                yield sse_event(current, encode_event("ready", {}))
+            for seq, message in missed or ():
+                yield sse_event(self.event_id(seq), message)
+            while True:
+                try:
+                    item = await asyncio.wait_for(conn.queue.get(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if item is None:
+                    # Too far behind; it reconnects and resumes from its last id
+                    logger.warning(f"Dropping slow event stream of user {user_id}")
+                    return
+                seq, message = item
+                yield sse_event(self.event_id(seq), message)
+        finally:
+            streams = self._streams.get(user_id)
+            if streams is not None:
+                streams.discard(conn)
+                if not streams:
+                    del self._streams[user_id]
+            # Keep recording for a reconnect with Last-Event-ID
+            asyncio.get_running_loop().call_later(
+                self.replay_grace, lambda: asyncio.ensure_future(self._release(user_id))
+            )
+
+    @asynccontextmanager
+    async def park(self, user_id: str) -> AsyncIterator[Callable[[float], Awaitable[bool]]]:
+        """Wait for the next event that reaches `user_id` (their channel or a broadcast).
+
+        Events on the user's channel wake `wait` at once; broadcasts do so
+        within PARKED_BATCH_SECONDS + PARKED_SPREAD_SECONDS.
+
+            async with hub.park(user_id) as wait:
+                ...check for changes...
+                woken = await wait(timeout)
+
+        Events count from entering the block, so one arriving while the body
+        checks for changes still wakes `wait` (it then returns at once).
+        """
+        parked = self._parked.get(user_id)
+        if parked is None:
+            parked = self._parked[user_id] = Parked()
+        parked.count += 1
+        event = parked.event
+
+        async def wait(timeout: float) -> bool:
+            try:
+                await asyncio.wait_for(event.wait(), timeout)
+                return True
+            except asyncio.TimeoutError:
+                return False
+
+        try:
+            await self._retain(user_id)
+            try:
+                yield wait
+            finally:
+                await self._release(user_id)
+        finally:
+            parked.count -= 1
+            if not parked.count and self._parked.get(user_id) is parked:
+                del self._parked[user_id]
+
+    async def serve(self, websocket: WebSocket, user_id: str):
+        """Pump events to an accepted socket until either side goes away."""
+        conn = Connection(websocket, user_id, self.queue_size)
+        self._connections[user_id].add(conn)
+        tasks = []
+        retained = False
+        try:
+            await self._retain(user_id)
+            retained = True
+            tasks = [asyncio.ensure_future(self._send_loop(conn)), asyncio.ensure_future(self._receive_loop(conn))]
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            conns = self._connections.get(user_id)
+            if conns is not None:
+                conns.discard(conn)
+                if not conns:
+                    del self._connections[user_id]
+            if retained:
+                await self._release(user_id)
+
+    async def _send_loop(self, conn: Connection):
+        while True:
+            try:
+                message: Optional[str] = await asyncio.wait_for(conn.queue.get(), self.heartbeat)
+            except asyncio.TimeoutError:
+                message = PING
+            try:
+                if message is None:
+                    logger.warning(f"Dropping slow websocket consumer for user {conn.user_id}")
+                    await conn.websocket.close(code=WS_1013_TRY_AGAIN_LATER)
+                    return
+                await conn.websocket.send_text(message)
+            except Exception as e:  # Peer went away mid-send
+                logger.debug(f"Websocket send to user {conn.user_id} failed: {e}")
+                return
+
+    async def _receive_loop(self, conn: Connection):
+        # Clients only send keep-alives; reading is how a disconnect is noticed
+        while True:
+            message = await conn.websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
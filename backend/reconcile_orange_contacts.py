@@ -0,0 +1,51 @@
+
+import asyncio
+
+from server import client, db, with_version, users_written_by_script
+
+async def reconcile_contacts():
+    """Rebuild the stored Orange Mode contact counters from the conversations.
+
+    `availability.currentContacts` is maintained incrementally by the API. This
+    recomputes it for every Orange user as the number of conversations with
+    messages whose timer started after the user's current session began.
+    """
+    print("Reconciling Orange Mode contact counters...")
+    
+    fixed = []
+    cursor = db.users.find({"availabilityMode": "orange"}, {"name": 1, "availability": 1, "orangeContactKeys": 1})
+    async for u in cursor:
+        avail = u.get('availability') or {}
+        mode_start = avail.get('modeStartedAt') or 0
+        
+        active = await db.conversations.find({
+            "participants": u['_id'],
+            "$or": [{"messageCount": {"$gt": 0}}, {"messages.0": {"$exists": True}}],
+            "timerStarted": {"$gt": mode_start}
+        }, {"pairKey": 1}).to_list(None)
+        actual = len(active)
+        # The pairs holding a slot, which send_message checks before taking another
+        keys = sorted(c['pairKey'] for c in active if c.get('pairKey'))
+        stored = avail.get('currentContacts', 0)
+        
+        if stored != actual or sorted(u.get('orangeContactKeys') or []) != keys:
+            await db.users.update_one(
+                {"_id": u['_id']},
+                with_version({
+                    "$set": {
+                        "availability.currentContacts": actual,
+                        "orangeContactKeys": keys,
+                    },
+                })
+            )
+            fixed.append(u['_id'])
+            print(f"User {u.get('name')}: {stored} -> {actual}")
+    
+    if fixed:
+        await users_written_by_script(fixed)
+    print(f"Reconcile complete. Fixed {len(fixed)} users.")
+    
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(reconcile_contacts())
@@ -1,20 +1,9 @@
 
-import os
 import asyncio
-from motor.motor_asyncio import AsyncIOMotorClient
-from dotenv import load_dotenv
-from pathlib import Path
 
-ROOT_DIR = Path('/app/backend')
-load_dotenv(ROOT_DIR / '.env')
-
-MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-DB_NAME = os.environ.get('DB_NAME', 'aviato_db')
+from server import client, db, advance_clocks, conversations_clock, users_written_by_script
 
 async def remove_test_users():
-    client = AsyncIOMotorClient(MONGO_URL)
-    db = client[DB_NAME]
-    
     print("Identifying test users...")
     
     # Logic: Remove users with @test.com email OR "Test" in name
@@ -51,12 +40,17 @@ async def remove_test_users():
     # Or just remove the conversation? Yes, delete the conversation.
     
     # Find conversations where 'participants' array contains any of ids_to_delete
+    participants = await db.conversations.distinct("participants", {"participants": {"$in": ids_to_delete}})
     conv_result = await db.conversations.delete_many({
         "participants": {"$in": ids_to_delete}
     })
     
     print(f"Deleted {conv_result.deleted_count} conversations involving test users.")
     
+    # Move the list ETags and drop the profiles cached by running workers
+    await advance_clocks(*[conversations_clock(user_id) for user_id in participants])
+    await users_written_by_script(ids_to_delete)
+    
     # Verify remaining
     remaining = await db.users.find({}).to_list(1000)
     print("\nRemaining Users (Real):")
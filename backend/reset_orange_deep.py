@@ -1,21 +1,9 @@
 
-import os
 import asyncio
-from motor.motor_asyncio import AsyncIOMotorClient
-from dotenv import load_dotenv
-from pathlib import Path
-from datetime import datetime
 
-ROOT_DIR = Path('/app/backend')
-load_dotenv(ROOT_DIR / '.env')
-
-MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-DB_NAME = os.environ.get('DB_NAME', 'aviato_db')
+from server import client, db, now_ms, with_version, advance_clocks, conversations_clock, users_written_by_script
 
 async def reset_orange_state():
-    client = AsyncIOMotorClient(MONGO_URL)
-    db = client[DB_NAME]
-    
     print("Resetting Orange Mode state (Deep Clean)...")
     
     # 1. Find all Orange Mode users
@@ -26,23 +14,28 @@ async def reset_orange_state():
     
     if orange_ids:
         # 2. Delete ALL conversations involving these users
+        participants = await db.conversations.distinct("participants", {"participants": {"$in": orange_ids}})
         result = await db.conversations.delete_many({
             "participants": {"$in": orange_ids}
         })
         print(f"Deleted {result.deleted_count} conversations involving Orange users.")
+        # Moves the GET /conversations ETag of everyone who was in one
+        await advance_clocks(*[conversations_clock(user_id) for user_id in participants])
         
         # 3. Reset the fallback 'currentContacts' AND update 'modeStartedAt' to now
         # This ensures any 'ghost' conversations are strictly ignored
-        now_ts = datetime.now().timestamp() * 1000
+        now_ts = now_ms()
         await db.users.update_many(
             {"_id": {"$in": orange_ids}},
-            {
+            with_version({
                 "$set": {
                     "availability.currentContacts": 0,
-                    "availability.modeStartedAt": now_ts
+                    "availability.modeStartedAt": now_ts,
+                    "orangeContactKeys": []
                 }
-            }
+            })
         )
+        await users_written_by_script(orange_ids)
         print(f"Reset availability.currentContacts to 0 and modeStartedAt to {now_ts}.")
 
     client.close()
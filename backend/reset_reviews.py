@@ -1,33 +1,26 @@
 
-import os
 import asyncio
-from motor.motor_asyncio import AsyncIOMotorClient
-from dotenv import load_dotenv
-from pathlib import Path
 
-ROOT_DIR = Path('/app/backend')
-load_dotenv(ROOT_DIR / '.env')
-
-MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-DB_NAME = os.environ.get('DB_NAME', 'aviato_db')
+from server import client, db, with_version, users_written_by_script
 
 async def reset_reviews():
-    client = AsyncIOMotorClient(MONGO_URL)
-    db = client[DB_NAME]
-    
     print("Resetting reviews...")
+    deleted = await db.reviews.delete_many({})
+    user_ids = await db.users.distinct("_id")
     result = await db.users.update_many(
         {},
-        {
+        with_version({
             "$set": {
-                "reviews": [],
                 "reviewRating": 0.0,
+                "reviewSum": 0.0,
                 "reviewCount": 0
-            }
-        }
+            },
+            "$unset": {"reviews": ""}
+        })
     )
+    await users_written_by_script(user_ids)
     
-    print(f"Reset complete. Modified {result.modified_count} users.")
+    print(f"Reset complete. Deleted {deleted.deleted_count} reviews, modified {result.modified_count} users.")
     client.close()
 
 if __name__ == "__main__":
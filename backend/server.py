@@ -1,21 +1,44 @@
 
 import os
+import time
+import copy
 import logging
 import uuid
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+import json
+import base64
+import hashlib
 from datetime import datetime, timedelta
-from typing import List, Optional, Dict, Any, Union
+from typing import List, Optional, Dict, Any, Union, Literal, Tuple
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, HTTPException, Depends, status, Body, APIRouter, Request
+from fastapi import FastAPI, HTTPException, Depends, status, Body, APIRouter, Request, Query, Response, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, FileResponse, StreamingResponse, RedirectResponse
+from starlette.datastructures import UploadFile
+from fastapi.encoders import jsonable_encoder
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, IndexModel
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
 from pydantic import BaseModel, Field, EmailStr
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from dotenv import load_dotenv
 from pathlib import Path
 
+from media import MediaStore, MediaError, media_ref, is_data_url, THUMBNAIL_SIZES, MAX_MEDIA_BYTES, SAFE_CONTENT_TYPES
+from realtime import Hub
+from events import create_event_bus
+from metrics import counters, ratio, gauges, render_prometheus
+from cache import TTLCache, MemoryProfileCache, CACHES
+from executors import BoundedExecutor, Saturated
+from tracing import CommandTracer, PoolWaitTimer, RequestTracingMiddleware, route_stats
+from watchdog import LoopWatchdog
+from coalesce import single_flight, FLIGHTS
+from profiling import ProfilingMiddleware, verify_token, list_profiles, profile_path
+
 # --- Configuration & Setup ---
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -25,6 +48,31 @@ DB_NAME = os.environ.get('DB_NAME', 'aviato_db')
 SECRET_KEY = os.environ.get('SECRET_KEY', 'supersecretkey')
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 3000
+THUMBNAIL_WORKERS = int(os.environ.get('THUMBNAIL_WORKERS', '2'))
+# bcrypt threads, and how many logins/signups may wait for one before we answer 503
+PASSWORD_WORKERS = int(os.environ.get('PASSWORD_WORKERS', '4'))
+PASSWORD_QUEUE_LIMIT = int(os.environ.get('PASSWORD_QUEUE_LIMIT', '32'))
+# How realtime events reach sockets on other workers: memory (single process), mongo or redis
+EVENT_BUS = os.environ.get('EVENT_BUS', 'memory')
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+# Seconds a decoded token / a looked-up principal is reused (update_user invalidates the latter)
+TOKEN_CACHE_TTL = float(os.environ.get('TOKEN_CACHE_TTL', '60'))
+PRINCIPAL_CACHE_TTL = float(os.environ.get('PRINCIPAL_CACHE_TTL', '30'))
+# A request issuing more Mongo commands than this, or one query shape more than
+# TRACE_REPEAT_LIMIT times (N+1), is logged as a warning
+TRACE_MAX_COMMANDS = int(os.environ.get('TRACE_MAX_COMMANDS', '20'))
+TRACE_REPEAT_LIMIT = int(os.environ.get('TRACE_REPEAT_LIMIT', '5'))
+# Encoded GET /users/{id} profiles kept per worker (bytes), and how long at most (writes invalidate)
+PROFILE_CACHE_BYTES = int(os.environ.get('PROFILE_CACHE_BYTES', str(32 * 1024 * 1024)))
+PROFILE_CACHE_TTL = float(os.environ.get('PROFILE_CACHE_TTL', '300'))
+# Seconds an encoded GET /users body is reused for the same change stamp and parameters
+USERS_BODY_TTL = float(os.environ.get('USERS_BODY_TTL', '1'))
+# Log the event loop's stack when it has been blocked this long
+LOOP_BLOCK_THRESHOLD_MS = float(os.environ.get('LOOP_BLOCK_THRESHOLD_MS', '250'))
+# Requests with an X-Profile token signed with this secret are profiled (see profiling.py); empty = off
+PROFILE_SECRET = os.environ.get('PROFILE_SECRET', '')
+PROFILE_DIR = Path(os.environ.get('PROFILE_DIR', ROOT_DIR / 'profiles'))
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', '50'))
 
 # Logging
 logging.basicConfig(level=logging.INFO)
@@ -32,11 +80,38 @@ logger = logging.getLogger(__name__)
 
 # Security
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt costs tens to hundreds of ms of CPU (and releases the GIL); keep it off the event loop
+password_pool = BoundedExecutor("bcrypt", PASSWORD_WORKERS, PASSWORD_QUEUE_LIMIT)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
-# Database
-client = AsyncIOMotorClient(MONGO_URL)
+# Database; every command is attributed to the request that issued it (Server-Timing, GET /stats)
+client = AsyncIOMotorClient(MONGO_URL, event_listeners=[CommandTracer(), PoolWaitTimer()])
 db = client[DB_NAME]
+media = MediaStore(db)
+# Sockets connected to this process (GET /api/ws)
+hub = Hub()
+# Every authenticated request resolves its token: token -> email, email -> principal record
+token_cache = TTLCache("tokens", 10000, TOKEN_CACHE_TTL)
+principal_cache = TTLCache("principals", 10000, PRINCIPAL_CACHE_TTL)
+hub.on_invalidate("principal", principal_cache.invalidate)
+# GET /users/{id} bodies; swap in a shared ProfileCache to share it between workers
+profile_cache = MemoryProfileCache("profiles", PROFILE_CACHE_BYTES, PROFILE_CACHE_TTL)
+hub.on_invalidate("profile", profile_cache.invalidate)
+# Event-loop lag (/metrics), and the stack of whatever blocks the loop (logged)
+loop_watchdog = LoopWatchdog(block_threshold=LOOP_BLOCK_THRESHOLD_MS / 1000)
+
+# Read at scrape time (GET /metrics)
+gauges.register("executor_queue_depth", "Jobs waiting for a thread of a bounded executor.",
+                lambda: {(("executor", password_pool.name),): password_pool.queue_depth})
+gauges.register("executor_in_flight", "Jobs running or waiting on a bounded executor.",
+                lambda: {(("executor", password_pool.name),): password_pool.in_flight})
+gauges.register("realtime_clients", "Clients connected for server push, by transport.", lambda: {
+    (("transport", "websocket"),): hub.connection_count,
+    (("transport", "sse"),): hub.stream_count,
+    (("transport", "long_poll"),): hub.parked_count,
+})
+gauges.register("cache_bytes", "Memory held by byte-bounded caches.", lambda: {(("cache", profile_cache.name),): profile_cache.bytes})
+gauges.register("event_loop_lag_last_seconds", "Lag of the most recent event-loop probe.", lambda: loop_watchdog.last_lag)
 
 # --- Models ---
 
@@ -68,11 +143,12 @@ class User(BaseModel):
     profilePic: Optional[str] = None # Default is None (No Profile)
     selections: List[str] = []
     approvalRating: int = 0
-    reviewRating: float = 0.0
+    reviewRating: float = 0.0 # reviewSum / reviewCount, kept for sorting
+    reviewSum: float = 0.0
     reviewCount: int = 0
     availabilityMode: Optional[str] = None # 'green', 'blue', etc.
     availability: Availability = Field(default_factory=Availability)
-    reviews: List[Review] = []
+    createdAt: float = Field(default_factory=lambda: datetime.now().timestamp() * 1000)
 
     class Config:
         populate_by_name = True
@@ -102,11 +178,13 @@ class Conversation(BaseModel):
     # attached to the current user, we will emulate that structure or adapt.
     
     # Let's go with a cleaner backend approach:
-    # A Conversation document has 'participants': [id1, id2] and 'messages': [].
+    # A Conversation document has 'participants': [id1, id2]; its messages live in the
+    # 'messages' collection keyed by conversationId (older documents may still embed a
+    # 'messages' array until backend/migrate_messages.py has moved it).
     # But the frontend expects a list of objects where each object has "userId" (the OTHER person).
     
     participants: List[str]
-    messages: List[Message] = []
+    messageCount: int = 0
     timerStarted: Optional[float] = None
     timerExpired: bool = False
     rated: bool = False
@@ -133,6 +211,11 @@ class SignupRequest(BaseModel):
     password: str
     name: str
 
+class Principal(BaseModel):
+    """The authenticated caller, for endpoints that only need to know who it is."""
+    id: str
+    email: str
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -146,6 +229,286 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+async def run_password_job(fn, *args):
+    """Run verify_password/get_password_hash on the bcrypt pool; 503 when it is saturated."""
+    try:
+        return await password_pool.run(fn, *args)
+    except Saturated:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, please try again",
+            headers={"Retry-After": "1"},
+        )
+
+def orange_session_start(user: dict) -> float:
+    """Start of the user's current Orange Mode session (ms timestamp, 0 if never reset)."""
+    return (user.get('availability') or {}).get('modeStartedAt') or 0
+
+def now_ms() -> float:
+    return datetime.now().timestamp() * 1000
+
+def with_version(update: dict) -> dict:
+    """Add the change stamp (updatedAt, version) to a user/conversation update.
+
+    GET /sync finds changes by updatedAt; version backs the ETags of the reads.
+    """
+    return {
+        **update,
+        "$set": {**update.get("$set", {}), "updatedAt": now_ms()},
+        "$inc": {**update.get("$inc", {}), "version": 1},
+    }
+
+# Conversation metadata only; the $slice keeps a not-yet-migrated embedded
+# 'messages' array down to one element, enough for has_messages()
+CONVERSATION_META_PROJECTION = {"messages": {"$slice": -1}}
+
+def has_messages(conv: Optional[dict]) -> bool:
+    return bool(conv) and (conv.get('messageCount', 0) > 0 or bool(conv.get('messages')))
+
+def pair_key(user_a: str, user_b: str) -> str:
+    """Canonical, order-independent key of the conversation between two users."""
+    return "|".join(sorted((user_a, user_b)))
+
+async def get_or_create_conversation(
+    user_a: str,
+    user_b: str,
+    projection: Optional[dict] = None,
+    update: Optional[dict] = None,
+) -> Tuple[dict, bool]:
+    """Return (conversation, created) for the pair, inserting it if it doesn't exist.
+
+    The upsert on the unique pairKey index makes creation race-free: concurrent
+    first messages end up in the same conversation. An optional `update`
+    ($set/$inc/...) is applied in the same write; the returned document is the
+    state before it.
+    """
+    key = pair_key(user_a, user_b)
+    new_conv = {
+        "_id": str(uuid.uuid4()),
+        "participants": [user_a, user_b],
+        "messageCount": 0,
+        "created_at": datetime.now(),
+        "updatedAt": now_ms(),
+        "version": 1,
+    }
+    touched = {field for fields in (update or {}).values() for field in fields}
+    write = {**(update or {}), "$setOnInsert": {k: v for k, v in new_conv.items() if k not in touched}}
+    for attempt in range(2):
+        try:
+            existing = await db.conversations.find_one_and_update(
+                {"pairKey": key},
+                write,
+                projection=projection,
+                upsert=True,
+                return_document=ReturnDocument.BEFORE
+            )
+        except DuplicateKeyError:
+            # Lost an insert race on the unique index; the retry finds the winner
+            if attempt:
+                raise
+            continue
+        if update or not existing:
+            await conversation_written([user_a, user_b])
+        if existing:
+            return existing, False
+        return {**new_conv, "pairKey": key}, True
+
+async def key_legacy_conversation(user_a: str, user_b: str, projection: Optional[dict] = None) -> Optional[dict]:
+    """Stamp the pairKey on the pair's conversation from before keyed lookups, if there is one.
+
+    backend/backfill_pair_keys.py keys them all; until it has run, the pair's
+    conversation is keyed on first access instead (like messages and reviews
+    are moved), so the keyed lookups find it rather than starting a second one.
+    Returns the keyed conversation, or None if the pair has none.
+    """
+    if user_a == user_b:
+        return None
+    key = pair_key(user_a, user_b)
+    legacy = await db.conversations.find_one(
+        {"participants": {"$all": [user_a, user_b], "$size": 2}, "pairKey": {"$exists": False}},
+        {"_id": 1}, sort=[("_id", 1)]
+    )
+    if not legacy:
+        return None
+    try:
+        await db.conversations.update_one({"_id": legacy['_id'], "pairKey": {"$exists": False}}, {"$set": {"pairKey": key}})
+    except DuplicateKeyError:
+        pass  # Another request keyed the pair first; the backfill merges the rest
+    return await db.conversations.find_one({"pairKey": key}, projection)
+
+async def find_conversation(user_a: str, user_b: str, projection: Optional[dict] = None) -> Optional[dict]:
+    """The pair's conversation by pairKey, keying a legacy one on the way (see key_legacy_conversation)."""
+    conv = await db.conversations.find_one({"pairKey": pair_key(user_a, user_b)}, projection)
+    return conv or await key_legacy_conversation(user_a, user_b, projection)
+
+def message_doc(conversation_id: str, msg: dict) -> dict:
+    """Storage form of a message in the 'messages' collection."""
+    doc = {k: v for k, v in msg.items() if k != 'id'}
+    doc['_id'] = msg['id']
+    doc['conversationId'] = conversation_id
+    return doc
+
+def message_out(doc: dict) -> dict:
+    msg = {k: v for k, v in doc.items() if k not in ('_id', 'conversationId')}
+    msg['id'] = doc['_id']
+    return msg
+
+async def move_embedded_messages(conv: dict) -> int:
+    """Move a conversation's legacy embedded 'messages' array into the messages collection.
+
+    Idempotent: messages already copied by an interrupted run are skipped by _id.
+    `conv` must be the full document. Returns the number of messages moved.
+    """
+    if 'messages' not in conv:
+        return 0
+    embedded = conv['messages'] or []
+    if embedded:
+        try:
+            await db.messages.insert_many([message_doc(conv['_id'], m) for m in embedded], ordered=False)
+        except BulkWriteError as e:
+            if any(err.get('code') != 11000 for err in e.details.get('writeErrors', [])):
+                raise
+    updates = {"$unset": {"messages": ""}, "$inc": {"messageCount": len(embedded)}}
+    if embedded and not conv.get('last'):
+        # Summary fields for the chat list; newer messages would already have set them
+        last = embedded[-1]
+        updates["$set"] = {
+            "last": {k: last.get(k) for k in ("id", "senderId", "text", "timestamp")},
+            "lastMessageTime": last.get('timestamp'),
+        }
+    result = await db.conversations.update_one(
+        {"_id": conv['_id'], "messages": {"$exists": True}},
+        updates
+    )
+    if not result.modified_count:
+        return 0
+    await conversation_written(conv['participants'])
+    return len(embedded)
+
+def review_id(rater_id: str, target_id: str) -> str:
+    """_id of a review; a rater has at most one review of each user."""
+    return f"{rater_id}|{target_id}"
+
+def review_out(doc: dict) -> dict:
+    return {k: doc.get(k) for k in ("raterId", "raterName", "raterProfilePic", "rating", "timestamp")}
+
+def review_rating(review_sum: float, review_count: int) -> float:
+    return round(review_sum / review_count, 1) if review_count else 0.0
+
+async def stored_picture(pic: Optional[str]) -> Optional[str]:
+    """`pic`, with a legacy base64 data URL moved to the media store (None if it can't be stored)."""
+    if not is_data_url(pic):
+        return pic
+    try:
+        return media_ref(await media.put_data_url(pic))
+    except MediaError as e:
+        logger.warning(f"Dropped an unstorable profile picture: {e}")
+        return None
+
+async def move_embedded_reviews(user: dict) -> int:
+    """Move a user's legacy embedded 'reviews' array into the reviews collection.
+
+    Only a rater's last review of the user is kept. Idempotent: reviews
+    already copied by an interrupted run are skipped by _id, and the
+    aggregates are set only by the update that removes the array. `user`
+    must include 'reviews'. Returns the number of reviews moved.
+    """
+    if 'reviews' not in user:
+        return 0
+    latest = {r['raterId']: r for r in user['reviews'] or [] if r.get('raterId')}
+    docs = [
+        {"_id": review_id(rater_id, user['_id']), "targetId": user['_id'], **review_out(r)}
+        for rater_id, r in latest.items()
+    ]
+    # Reviews from before the media store may still carry the rater's picture inline
+    pics = await asyncio.gather(*[stored_picture(d['raterProfilePic']) for d in docs])
+    for d, pic in zip(docs, pics):
+        d['raterProfilePic'] = pic
+    if docs:
+        try:
+            await db.reviews.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            if any(err.get('code') != 11000 for err in e.details.get('writeErrors', [])):
+                raise
+    review_sum = sum(d['rating'] for d in docs)
+    result = await db.users.update_one(
+        {"_id": user['_id'], "reviews": {"$exists": True}},
+        with_version({
+            "$unset": {"reviews": ""},
+            "$set": {"reviewSum": review_sum, "reviewCount": len(docs), "reviewRating": review_rating(review_sum, len(docs))},
+        })
+    )
+    if not result.modified_count:
+        return 0
+    await user_written(user['_id'])
+    return len(docs)
+
+def counts_as_new_contact(conv: Optional[dict], user: dict) -> bool:
+    """Whether a message in `conv` takes a new Orange slot in `user`'s current session.
+
+    A conversation holds a slot once it has messages and its timer was (re)started
+    after the session began - the same rule the stored counter is maintained with.
+    """
+    if not has_messages(conv):
+        return True
+    return (conv.get('timerStarted') or 0) <= orange_session_start(user)
+
+async def reserve_orange_slot(user_id: str, key: str) -> bool:
+    """Atomically take one contact slot of an Orange user's current session for the pair `key`.
+
+    The conditional $inc only matches while currentContacts < maxContact, so
+    concurrent senders can never push the user past the limit. The same write
+    records the pair in orangeContactKeys (cleared with the session), and a
+    pair already recorded never takes a second slot.
+    """
+    result = await db.users.update_one(
+        {
+            "_id": user_id,
+            "availabilityMode": "orange",
+            "orangeContactKeys": {"$ne": key},
+            "$expr": {"$lt": [
+                {"$ifNull": ["$availability.currentContacts", 0]},
+                {"$ifNull": ["$availability.maxContact", 0]},
+            ]},
+        },
+        with_version({"$inc": {"availability.currentContacts": 1}, "$addToSet": {"orangeContactKeys": key}})
+    )
+    return result.modified_count == 1
+
+async def holds_orange_slot(user_id: str, key: str) -> bool:
+    """Whether the pair `key` already has a slot in the user's current Orange session.
+
+    After a failed reserve_orange_slot this can't miss a concurrent message of
+    the same pair: its slot and its key landed in one write, before ours was refused.
+    """
+    return bool(await db.users.find_one({"_id": user_id, "orangeContactKeys": key}, {"_id": 1}))
+
+async def release_orange_slot(user_id: str):
+    await db.users.update_one(
+        {"_id": user_id, "availability.currentContacts": {"$gt": 0}},
+        with_version({"$inc": {"availability.currentContacts": -1}})
+    )
+
+async def user_written(user_id: str):
+    """After writing a user's document: advance the users clock and drop cached copies of the profile on every worker."""
+    profile_cache.invalidate(user_id)
+    await asyncio.gather(advance_clocks(USERS_CLOCK), hub.invalidate("profile", user_id))
+
+async def users_written_by_script(user_ids: List[str]):
+    """user_written() for maintenance scripts that write user documents directly.
+
+    The app's lifespan doesn't run in a script, so the hub is first switched to
+    the configured event bus; with EVENT_BUS=memory running workers can't be
+    reached and drop their copies when PROFILE_CACHE_TTL runs out.
+    """
+    hub.use(create_event_bus(EVENT_BUS, db, REDIS_URL))
+    try:
+        await advance_clocks(USERS_CLOCK)
+        for user_id in user_ids:
+            await hub.invalidate("profile", user_id)
+    finally:
+        await hub.bus.stop()
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -156,30 +519,230 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
+# What get_current_user hands to handlers; reviews and the password hash stay in the database
+PRINCIPAL_PROJECTION = {"password": 0, "reviews": 0, "orangeContactKeys": 0}
+# What the API returns for a user. Reviews are paged through GET /users/{id}/reviews;
+# the projection only matters for users whose legacy embedded array isn't migrated yet.
+# orangeContactKeys names who is talking to whom and stays server-side.
+USER_PROJECTION = {"password": 0, "reviews": 0, "orangeContactKeys": 0}
+
+async def cached_principal(token: str) -> dict:
+    """The caller's (shared, cached) user record; raises 401 for a bad token."""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
+    email = token_cache.get(token)
+    if email is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            email: str = payload.get("sub")
+            if email is None:
+                raise credentials_exception
+        except JWTError:
             raise credentials_exception
-    except JWTError:
-        raise credentials_exception
+        # Never reused past the token's own expiry
+        token_cache.set(token, email, ttl=payload.get("exp", 0) - time.time())
         
-    user = await db.users.find_one({"email": email})
+    user = principal_cache.get(email)
     if user is None:
-        raise credentials_exception
-    
-    # Map _id to id
-    user['id'] = str(user['_id'])
-    del user['_id']
-    if 'password' in user: del user['password']
+        user = await db.users.find_one({"email": email}, PRINCIPAL_PROJECTION)
+        if user is None:
+            raise credentials_exception
+        # Map _id to id
+        user['id'] = str(user['_id'])
+        del user['_id']
+        principal_cache.set(email, user)
     return user
 
+async def user_from_token(token: str) -> dict:
+    # Handlers get their own copy of the cached record
+    return copy.deepcopy(await cached_principal(token))
+
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    return await user_from_token(token)
+
+async def get_principal(token: str = Depends(oauth2_scheme)) -> Principal:
+    user = await cached_principal(token)
+    return Principal(id=user['id'], email=user['email'])
+
+def conversation_summary(conv: dict, user_id: str) -> Optional[dict]:
+    """A conversation as `user_id` sees it in the chat list."""
+    # Transform for frontend
+    other_user_id = next((pid for pid in conv['participants'] if pid != user_id), None)
+    if not other_user_id:
+        return None
+    
+    # Denormalized by send_message; not-yet-migrated documents fall back to
+    # the last embedded message (and report a messageCount of at least 1)
+    last_message = conv.get('last') or (conv.get('messages') or [None])[-1]
+    
+    return {
+        "id": str(conv['_id']),
+        "userId": other_user_id,
+        "messageCount": conv.get('messageCount', 0) + len(conv.get('messages') or []),
+        "timerStarted": conv.get('timerStarted'),
+        "timerExpired": conv.get('timerExpired', False),
+        "rated": conv.get('rated', False),
+        "lastMessage": last_message['text'] if last_message else "",
+        "lastMessageTime": last_message['timestamp'] if last_message else conv.get('timestamp', 0),
+        "lastMessageSenderId": last_message['senderId'] if last_message else None,
+        # Simple logic for now
+        "waitingForResponse": last_message['senderId'] == user_id if last_message else False,
+        "theyRespondedLast": last_message['senderId'] != user_id if last_message else False,
+    }
+
+async def publish_conversation(event_type: str, conv: dict, extra: Optional[dict] = None):
+    """Push a conversation event to both participants, each with their own summary."""
+    for user_id in conv['participants']:
+        await hub.publish([user_id], event_type, {"conversation": conversation_summary(conv, user_id), **(extra or {})})
+
+def encode_cursor(values: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+def keyset_after(field: str, value, last_id: str) -> dict:
+    """Filter for the documents after (value, last_id) in a (field desc, _id desc) sort.
+
+    Documents missing `field` sort last in descending order, so once the cursor
+    is past every real value only the missing ones remain.
+    """
+    if value is None:
+        return {field: None, "_id": {"$lt": last_id}}
+    return {"$or": [
+        {field: {"$lt": value}},
+        {field: value, "_id": {"$lt": last_id}},
+        {field: None},
+    ]}
+
+# --- Conditional GETs ---
+# ETags come from document versions / change stamps, never from hashing the body,
+# so a matching If-None-Match skips the full read and the JSON encoding.
+def etag_for(*parts) -> str:
+    return '"' + "-".join(str(p) for p in parts) + '"'
+
+def if_none_match(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [c.strip() for c in header.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+def not_modified(request: Request, response: Response, route: str, etag: str, private: bool = False) -> Optional[Response]:
+    """Tag `response` with `etag`; returns the 304 to send instead if the client already has it."""
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache" if private else "no-cache"}
+    if private:
+        headers["Vary"] = "Authorization"
+    counters.inc("etag_requests_total", route=route)
+    if if_none_match(request, etag):
+        counters.inc("etag_not_modified_total", route=route)
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+# The list ETags come from change clocks: counters in the change_clocks collection
+# that every write to what a list shows advances with $inc, once the write has
+# landed. Unlike the highest updatedAt (the writing worker's wall clock) they
+# can't stand still on a tie or when workers' clocks disagree. Read a clock
+# before the data it tags: a write racing the read then only costs one extra 200.
+USERS_CLOCK = "users"
+
+def conversations_clock(user_id: str) -> str:
+    """Clock of one user's conversation list."""
+    return f"conversations:{user_id}"
+
+async def advance_clocks(*names: str):
+    await asyncio.gather(*[
+        db.change_clocks.update_one({"_id": name}, {"$inc": {"seq": 1}}, upsert=True)
+        for name in names
+    ])
+
+async def read_clock(name: str) -> int:
+    doc = await db.change_clocks.find_one({"_id": name})
+    return doc["seq"] if doc else 0
+
+async def conversation_written(participants: List[str]):
+    """Advance the conversation-list clocks of a conversation's participants after writing it."""
+    await advance_clocks(*[conversations_clock(user_id) for user_id in participants])
+
+def json_body(content: Any) -> bytes:
+    """`content` encoded the way FastAPI's JSONResponse would, once, for sharing between requests."""
+    return json.dumps(jsonable_encoder(content), ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+def prepared_json(body: bytes, response: Response) -> Response:
+    """Send an already-encoded JSON body along with the headers set on `response` (ETag, ...)."""
+    headers = {k: v for k, v in response.headers.items() if k not in ("content-length", "content-type")}
+    return Response(body, media_type="application/json", headers=headers)
+
+# --- Indexes ---
+# Discovery sort keys for GET /users
+USER_SORT_FIELDS = {
+    "approvalRating": "approvalRating",
+    "reviewRating": "reviewRating",
+    "recent": "createdAt",
+}
+
+# Every index the queries rely on, per collection. Applied at startup;
+# backend/test_query_plans.py checks that no endpoint query falls back to a COLLSCAN.
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        # Login, signup and every token -> principal lookup
+        IndexModel("email", unique=True, name="email_unique"),
+        # Keyset pagination for GET /users (sort field desc, _id desc)
+        *[IndexModel([(field, -1), ("_id", -1)]) for field in USER_SORT_FIELDS.values()],
+        # GET /sync
+        IndexModel("updatedAt"),
+    ],
+    "conversations": [
+        # One conversation per pair of users; partial so that documents not keyed
+        # yet (backend/backfill_pair_keys.py, key_legacy_conversation) don't collide
+        IndexModel("pairKey", unique=True, partialFilterExpression={"pairKey": {"$exists": True}}),
+        # Conversation list, most recent activity first
+        IndexModel([("participants", 1), ("lastMessageTime", -1)]),
+        # GET /sync
+        IndexModel([("participants", 1), ("updatedAt", 1)]),
+        # Conversations whose timer (re)started after a point in time (Orange session counting)
+        IndexModel([("participants", 1), ("timerStarted", 1)]),
+    ],
+    "messages": [
+        # Conversation history, newest first
+        IndexModel([("conversationId", 1), ("timestamp", -1), ("_id", -1)]),
+    ],
+    "reviews": [
+        # A user's reviews, newest first (the _id "<raterId>|<targetId>" is the upsert key)
+        IndexModel([("targetId", 1), ("timestamp", -1), ("_id", -1)]),
+        # The users a caller has already rated
+        IndexModel("raterId"),
+    ],
+}
+
+async def ensure_indexes():
+    """Create the INDEXES registry; existing indexes are left as they are.
+
+    An index that can't be built (e.g. duplicate emails already stored) is
+    logged and skipped so the server still starts.
+    """
+    for collection, models in INDEXES.items():
+        try:
+            await db[collection].create_indexes(models)
+        except OperationFailure:
+            # Find out which one failed; the others still get created
+            for model in models:
+                try:
+                    await db[collection].create_indexes([model])
+                except OperationFailure as e:
+                    logger.error(f"Index {collection}.{model.document['name']} not created: {e}")
+
 # --- Seed Data ---
 async def seed_data():
     if await db.users.count_documents({}) > 0:
@@ -193,10 +756,23 @@ async def seed_data():
 
 # --- Routes ---
 
+thumbnail_pool: Optional[ProcessPoolExecutor] = None
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    global thumbnail_pool
+    await ensure_indexes()
     await seed_data()
+    # Image decoding/resizing is CPU-bound; keep it off the event loop and out of the GIL
+    thumbnail_pool = ProcessPoolExecutor(max_workers=THUMBNAIL_WORKERS)
+    hub.use(create_event_bus(EVENT_BUS, db, REDIS_URL))
+    await hub.bus.start()
+    loop_watchdog.start()
     yield
+    await loop_watchdog.stop()
+    await hub.bus.stop()
+    thumbnail_pool.shutdown(wait=False, cancel_futures=True)
+    password_pool.shutdown()
 
 app = FastAPI(lifespan=lifespan)
 api = APIRouter(prefix="/api")
@@ -210,7 +786,7 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
         logger.warning(f"Login failed: User {form_data.username} not found")
         raise HTTPException(status_code=400, detail="Incorrect email or password")
 
-    if not verify_password(form_data.password, user['password']):
+    if not await run_password_job(verify_password, form_data.password, user['password']):
         logger.warning(f"Login failed: Invalid password for {form_data.username}")
         raise HTTPException(status_code=400, detail="Incorrect email or password")
     
@@ -222,6 +798,8 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     user['id'] = str(user['_id'])
     del user['_id']
     del user['password']
+    user.pop('reviews', None)
+    user.pop('orangeContactKeys', None)
     
     return {"access_token": access_token, "token_type": "bearer", "user": user}
 
@@ -234,12 +812,19 @@ async def signup(req: SignupRequest):
     new_user = User(
         email=req.email,
         name=req.name,
-        password=get_password_hash(req.password),
+        password=await run_password_job(get_password_hash, req.password),
         availabilityMode="green"
     ).model_dump()
     new_user['_id'] = new_user['id']
+    new_user['updatedAt'] = now_ms()
+    new_user['version'] = 1
     
-    await db.users.insert_one(new_user)
+    try:
+        await db.users.insert_one(new_user)
+    except DuplicateKeyError:
+        # Same email signed up concurrently (unique index on email)
+        raise HTTPException(status_code=400, detail="Email already registered")
+    await user_written(new_user['_id'])
     
     access_token = create_access_token(data={"sub": req.email})
     
@@ -249,56 +834,104 @@ async def signup(req: SignupRequest):
     return {"access_token": access_token, "token_type": "bearer", "user": new_user}
 
 @api.get("/auth/me")
-async def read_users_me(current_user: dict = Depends(get_current_user)):
-    return current_user
+async def read_users_me(request: Request, response: Response, principal: Principal = Depends(get_principal)):
+    # The stored document, not the cached principal
+    user = await db.users.find_one({"_id": principal.id}, USER_PROJECTION)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    etag = etag_for("me", principal.id, user.get('version', 0))
+    cached = not_modified(request, response, "auth_me", etag, private=True)
+    if cached:
+        return cached
+    user['id'] = str(user['_id'])
+    del user['_id']
+    return user
 
 # User Routes
-@api.get("/users")
-async def get_users():
-    users = await db.users.find({}, {"password": 0}).to_list(1000)
+
+@single_flight("users.stamp")
+async def users_change_stamp() -> int:
+    return await read_clock(USERS_CLOCK)
+
+# Keyed by the change stamp, so a body is never reused after a user write
+@single_flight("users.body", ttl=USERS_BODY_TTL)
+async def users_body(stamp: int, limit: Optional[int], after: Optional[str], sort: Optional[str]) -> bytes:
+    if limit is None and after is None and sort is None:
+        # Legacy unpaginated listing (AppContext polling)
+        users = await db.users.find({}, USER_PROJECTION).to_list(1000)
+        for u in users:
+            u['id'] = str(u['_id'])
+            del u['_id']
+        # Orange Mode 'availability.currentContacts' is stored on the user and kept
+        # up to date by send_message / update_user, so no per-user count is needed here.
+        return json_body(users)
+
+    # Keyset-paginated listing, sorted in the database
+    field = USER_SORT_FIELDS[sort or "approvalRating"]
+    limit = limit or 50
+    query = {}
+    if after:
+        values = decode_cursor(after)
+        if len(values) != 2:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = keyset_after(field, values[0], values[1])
+
+    users = await db.users.find(query, USER_PROJECTION).sort([(field, -1), ("_id", -1)]).limit(limit).to_list(limit)
+
+    next_cursor = None
+    if len(users) == limit:
+        last = users[-1]
+        next_cursor = encode_cursor([last.get(field), last['_id']])
     for u in users:
         u['id'] = str(u['_id'])
         del u['_id']
-        
-        # --- ORANGE MODE DYNAMIC COUNT (Active Conversations) ---
-        if u.get('availabilityMode') == 'orange':
-            # Count conversations that:
-            # 1. Involve this user
-            # 2. Have at least one message (messages array is not empty)
-            # This ensures simply "viewing" (empty chat) doesn't burn a slot.
-            active_count = await db.conversations.count_documents({
-                "participants": u['id'],
-                "messages": {"$not": {"$size": 0}}
-            })
-            if 'availability' not in u: u['availability'] = {}
-            u['availability']['currentContacts'] = active_count
-        # ---------------------------------
-        
-    return users
+    return json_body({"users": users, "nextCursor": next_cursor})
 
-@api.get("/users/{user_id}")
-async def get_user(user_id: str):
-    user = await db.users.find_one({"_id": user_id}, {"password": 0})
+@api.get("/users")
+async def get_users(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=200),
+    after: Optional[str] = None,
+    sort: Optional[Literal["approvalRating", "reviewRating", "recent"]] = None,
+):
+    # Any user write advances the users clock; the query shape is part of the tag
+    stamp = await users_change_stamp()
+    shape = hashlib.sha1(repr((limit, after, sort)).encode()).hexdigest()[:12]
+    cached = not_modified(request, response, "users", etag_for("users", stamp, shape))
+    if cached:
+        return cached
+    return prepared_json(await users_body(stamp, limit, after, sort), response)
+
+@single_flight("user.body")
+async def user_body(user_id: str, generation: int) -> Optional[Tuple[int, bytes]]:
+    """(version, encoded profile) of a user, None if there's no such user; fills the profile cache."""
+    user = await db.users.find_one({"_id": user_id}, USER_PROJECTION)
     if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+        return None
     user['id'] = str(user['_id'])
     del user['_id']
-    
-    # --- ORANGE MODE DYNAMIC COUNT (Active Session) ---
-    if user.get('availabilityMode') == 'orange':
-        # Count conversations that became active (message sent) AFTER the mode started/reset
-        mode_start = user.get('availability', {}).get('modeStartedAt', 0)
-        
-        active_count = await db.conversations.count_documents({
-            "participants": user['id'],
-            "messages": {"$not": {"$size": 0}},
-            "timerStarted": {"$gt": mode_start}
-        })
-        if 'availability' not in user: user['availability'] = {}
-        user['availability']['currentContacts'] = active_count
-    # ---------------------------------
-    
-    return user
+    version, body = user.get('version', 0), json_body(user)
+    await profile_cache.set(user_id, version, body, generation)
+    return version, body
+
+async def cached_profile(user_id: str) -> Optional[Tuple[int, bytes]]:
+    found = await profile_cache.get(user_id)
+    if found is None:
+        # The generation is part of the key: reads started after a write don't join one from before it
+        found = await user_body(user_id, profile_cache.generation(user_id))
+    return found
+
+@api.get("/users/{user_id}")
+async def get_user(user_id: str, request: Request, response: Response):
+    found = await cached_profile(user_id)
+    if not found:
+        raise HTTPException(status_code=404, detail="User not found")
+    version, body = found
+    cached = not_modified(request, response, "user", etag_for("user", user_id, version))
+    if cached:
+        return cached
+    return prepared_json(body, response)
 
 @api.put("/users/{user_id}")
 async def update_user(user_id: str, updates: UserUpdate, current_user: dict = Depends(get_current_user)):
@@ -307,7 +940,10 @@ async def update_user(user_id: str, updates: UserUpdate, current_user: dict = De
     
     update_data = updates.model_dump(exclude_unset=True)
     if not update_data:
-        return current_user
+        user = await db.users.find_one({"_id": user_id}, USER_PROJECTION)
+        user['id'] = str(user['_id'])
+        del user['_id']
+        return user
         
     # If switching to Orange Mode OR updating Orange Mode settings, reset the session timer
     # We reset if 'availabilityMode' is explicitly set to 'orange', 
@@ -319,12 +955,23 @@ async def update_user(user_id: str, updates: UserUpdate, current_user: dict = De
     elif current_user.get('availabilityMode') == 'orange' and 'availability' in update_data:
         should_reset = True
         
+    # Pictures go to the media store; the user document only keeps the reference
+    if is_data_url(update_data.get('profilePic')):
+        try:
+            update_data['profilePic'] = media_ref(await media.put_data_url(update_data['profilePic']))
+        except MediaError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
     if should_reset:
         # Set modeStartedAt to NOW
-        if 'availability' not in update_data: update_data['availability'] = {}
-        # Preserve existing availability data if doing a partial update? 
-        # Pydantic dump includes everything set in model. If frontend sends full object, we are good.
+        if not update_data.get('availability'): update_data['availability'] = {}
         update_data['availability']['modeStartedAt'] = datetime.now().timestamp() * 1000
+        # New session: no conversation has been active since it started
+        update_data['availability']['currentContacts'] = 0
+    elif update_data.get('availability') is not None:
+        # The contact counter is server-owned (send_message moves it concurrently);
+        # leave the stored value alone, never take it from the client
+        update_data['availability'].pop('currentContacts', None)
         
     # --- BLUE MODE VALIDATION ---
     if update_data.get('availabilityMode') == 'blue':
@@ -347,116 +994,334 @@ async def update_user(user_id: str, updates: UserUpdate, current_user: dict = De
                 pass
     # ----------------------------
 
-    await db.users.update_one({"_id": user_id}, {"$set": update_data})
+    # Availability is written field by field, so fields not sent (the contact
+    # counter in particular) keep their stored values
+    set_fields = {k: v for k, v in update_data.items() if k != 'availability'}
+    for field, value in (update_data.get('availability') or {}).items():
+        set_fields[f'availability.{field}'] = value
+    if should_reset:
+        set_fields['orangeContactKeys'] = []
+    await db.users.update_one({"_id": user_id}, with_version({"$set": set_fields}))
+    # Mode and availability feed later authorization decisions; drop the cached principal everywhere
+    principal_cache.invalidate(current_user['email'])
+    await hub.invalidate("principal", current_user['email'])
+    await user_written(user_id)
     
-    updated_user = await db.users.find_one({"_id": user_id}, {"password": 0})
+    updated_user = await db.users.find_one({"_id": user_id}, USER_PROJECTION)
     updated_user['id'] = str(updated_user['_id'])
     del updated_user['_id']
     
-    # --- ORANGE MODE DYNAMIC COUNT (Active Session) ---
-    if updated_user.get('availabilityMode') == 'orange':
-        mode_start = updated_user.get('availability', {}).get('modeStartedAt', 0)
-        
-        active_count = await db.conversations.count_documents({
-            "participants": updated_user['id'],
-            "messages": {"$not": {"$size": 0}},
-            "timerStarted": {"$gt": mode_start}
-        })
-        if 'availability' not in updated_user: updated_user['availability'] = {}
-        updated_user['availability']['currentContacts'] = active_count
-    # ---------------------------------
+    if 'availabilityMode' in update_data or 'availability' in update_data:
+        # Everyone's user list shows the mode; same shape as GET /users entries
+        await hub.broadcast("user.mode_changed", {"user": updated_user})
     
     return updated_user
 
 @api.post("/users/{user_id}/reviews")
 async def add_review(user_id: str, review: Review, current_user: dict = Depends(get_current_user)):
-    # Add review to user
-    await db.users.update_one(
+    """Add or replace the caller's review of a user, adjusting the user's rating aggregates."""
+    target = await db.users.find_one({"_id": user_id}, {"reviews": 1})
+    if not target:
+        raise HTTPException(status_code=404, detail="User not found")
+    # Not migrated yet: the aggregates must start from the embedded reviews
+    if 'reviews' in target:
+        await move_embedded_reviews(target)
+
+    # The rater is the caller, with their stored name and picture rather than what the client sent
+    doc = {
+        **review.model_dump(),
+        "raterId": current_user['id'],
+        "raterName": current_user.get('name') or review.raterName,
+        "raterProfilePic": await stored_picture(current_user.get('profilePic')),
+        "timestamp": now_ms(),
+        "targetId": user_id,
+    }
+    previous = await db.reviews.find_one_and_update(
+        {"_id": review_id(current_user['id'], user_id)},
+        {"$set": doc},
+        upsert=True,
+        projection={"rating": 1},
+        return_document=ReturnDocument.BEFORE
+    )
+    delta = doc['rating'] - previous['rating'] if previous else doc['rating']
+    updated = await db.users.find_one_and_update(
         {"_id": user_id},
-        {"$push": {"reviews": review.model_dump()}}
+        with_version({"$inc": {"reviewSum": delta, "reviewCount": 0 if previous else 1}}),
+        projection={"reviewSum": 1, "reviewCount": 1},
+        return_document=ReturnDocument.AFTER
     )
-    
-    # Recalculate ratings
-    user = await db.users.find_one({"_id": user_id})
-    if user and "reviews" in user:
-        reviews = user["reviews"]
-        if reviews:
-            total_rating = sum(r["rating"] for r in reviews)
-            avg_rating = total_rating / len(reviews)
-            review_count = len(reviews)
-            
-            await db.users.update_one(
-                {"_id": user_id},
-                {"$set": {"reviewRating": round(avg_rating, 1), "reviewCount": review_count}}
-            )
+    if not updated:
+        raise HTTPException(status_code=404, detail="User not found")
+    # The average follows the aggregates it was computed from; if another review
+    # moved them meanwhile, the filter misses and that review's update sets it.
+    rating = review_rating(updated['reviewSum'], updated['reviewCount'])
+    await db.users.update_one(
+        {"_id": user_id, "reviewSum": updated['reviewSum'], "reviewCount": updated['reviewCount']},
+        with_version({"$set": {"reviewRating": rating}})
+    )
+    await user_written(user_id)
+    await hub.broadcast("review.added", {
+        "userId": user_id,
+        "reviewRating": rating,
+        "reviewCount": updated['reviewCount'],
+    })
     
     return {"status": "success"}
 
+@api.get("/users/{user_id}/reviews")
+async def get_reviews(
+    user_id: str,
+    before: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+):
+    """A page of a user's reviews, newest first, starting just after the `before` cursor."""
+    user = await db.users.find_one({"_id": user_id}, {"reviews": 1})
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    # Not migrated yet: move this user's reviews over on first access
+    if 'reviews' in user:
+        await move_embedded_reviews(user)
+
+    query = {"targetId": user_id}
+    if before:
+        values = decode_cursor(before)
+        if len(values) != 2:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query.update(keyset_after("timestamp", values[0], values[1]))
+
+    docs = await db.reviews.find(query).sort([("timestamp", -1), ("_id", -1)]).limit(limit).to_list(limit)
+    next_before = encode_cursor([docs[-1]['timestamp'], docs[-1]['_id']]) if len(docs) == limit else None
+    return {"reviews": [review_out(d) for d in docs], "nextBefore": next_before}
+
+@api.get("/reviews/given")
+async def get_given_reviews(principal: Principal = Depends(get_principal)):
+    """The caller's rating of each user they have reviewed, by user id."""
+    docs = await db.reviews.find({"raterId": principal.id}, {"targetId": 1, "rating": 1}).to_list(None)
+    return {"ratings": {d['targetId']: d['rating'] for d in docs}}
+
+# Media Routes
+MEDIA_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Room for the multipart boundaries and part headers around the file itself
+MEDIA_UPLOAD_OVERHEAD = 16 * 1024
+
+@api.post("/media")
+async def upload_media(request: Request, principal: Principal = Depends(get_principal)):
+    """Store an image sent as multipart field `file`.
+
+    The form is parsed here rather than through an UploadFile parameter, which
+    FastAPI would read in full before any check could run: oversized bodies
+    are refused on their Content-Length first.
+    """
+    length = request.headers.get("content-length", "")
+    if not length.isdigit():
+        raise HTTPException(status_code=status.HTTP_411_LENGTH_REQUIRED, detail="Content-Length required")
+    if int(length) > MAX_MEDIA_BYTES + MEDIA_UPLOAD_OVERHEAD:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="File size too large (max 5MB)")
+    async with request.form(max_files=1, max_fields=1) as form:
+        file = form.get("file")
+        if not isinstance(file, UploadFile):
+            raise HTTPException(status_code=400, detail="Expected an image in the 'file' field")
+        data = await file.read(MAX_MEDIA_BYTES + 1)
+    try:
+        digest = await media.put(data)
+    except MediaError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"id": digest, "url": media_ref(digest)}
+
+@api.get("/media/{digest}")
+async def get_media(digest: str, request: Request, size: Optional[int] = None):
+    if len(digest) != 64 or any(ch not in "0123456789abcdef" for ch in digest):
+        raise HTTPException(status_code=404, detail="Media not found")
+    if size is not None and size not in THUMBNAIL_SIZES:
+        raise HTTPException(status_code=400, detail=f"size must be one of {list(THUMBNAIL_SIZES)}")
+
+    # Content-addressed: the digest (plus variant) is a strong validator and the bytes never change
+    etag = f'"{digest}-{size}"' if size else f'"{digest}"'
+    headers = {"ETag": etag, "Cache-Control": MEDIA_CACHE_CONTROL, "X-Content-Type-Options": "nosniff"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+
+    if size:
+        blob = await media.get_variant(digest, size, thumbnail_pool)
+        if not blob:
+            # No thumbnail (yet, or ever): point at the original without letting
+            # anything cache it under this variant's URL
+            return RedirectResponse(media_ref(digest), headers={"Cache-Control": "no-store"})
+    else:
+        blob = await media.get(digest)
+    if not blob:
+        raise HTTPException(status_code=404, detail="Media not found")
+    data, content_type = blob
+    if content_type not in SAFE_CONTENT_TYPES:
+        # Stored before uploads were sniffed (e.g. SVG): download it, never render it on our origin
+        headers.update({"Content-Disposition": "attachment", "Content-Security-Policy": "sandbox"})
+    return Response(content=data, media_type=content_type, headers=headers)
+
 # Conversation Routes
 @api.get("/conversations")
-async def get_conversations(current_user: dict = Depends(get_current_user)):
-    # Find conversations where current user is a participant
-    cursor = db.conversations.find({"participants": current_user['id']})
-    conversations = await cursor.to_list(1000)
+async def get_conversations(
+    request: Request,
+    response: Response,
+    limit: int = Query(1000, ge=1, le=1000),
+    principal: Principal = Depends(get_principal),
+):
+    """Conversation summaries, newest activity first; history comes from .../messages."""
+    clock = await read_clock(conversations_clock(principal.id))
+    etag = etag_for("conversations", principal.id, clock, limit)
+    cached = not_modified(request, response, "conversations", etag, private=True)
+    if cached:
+        return cached
+
+    # Find conversations where current user is a participant (index: participants, lastMessageTime)
+    cursor = db.conversations.find(
+        {"participants": principal.id}, CONVERSATION_META_PROJECTION
+    ).sort("lastMessageTime", -1).limit(limit)
+    conversations = await cursor.to_list(limit)
     
     result = []
     for conv in conversations:
-        # Transform for frontend
-        other_user_id = next((pid for pid in conv['participants'] if pid != current_user['id']), None)
-        if not other_user_id: continue # Should not happen
-        
-        # Calculate frontend fields
-        messages = conv.get('messages', [])
-        last_message = messages[-1] if messages else None
-        
-        conv_obj = {
-            "id": str(conv['_id']),
-            "userId": other_user_id,
-            "messages": messages,
-            "timerStarted": conv.get('timerStarted'),
-            "timerExpired": conv.get('timerExpired', False),
-            "rated": conv.get('rated', False),
-            "lastMessage": last_message['text'] if last_message else "",
-            "lastMessageTime": last_message['timestamp'] if last_message else conv.get('timestamp', 0),
-            "lastMessageSenderId": last_message['senderId'] if last_message else None,
-            # Simple logic for now
-            "waitingForResponse": last_message['senderId'] == current_user['id'] if last_message else False,
-            "theyRespondedLast": last_message['senderId'] != current_user['id'] if last_message else False,
-        }
+        conv_obj = conversation_summary(conv, principal.id)
+        if not conv_obj: continue # Should not happen
         result.append(conv_obj)
-        
-    # Sort by lastMessageTime descending (newest first)
-    result.sort(key=lambda x: x['lastMessageTime'], reverse=True)
     
     return result
 
+@api.get("/conversations/{conversation_id}/messages")
+async def get_messages(
+    conversation_id: str,
+    before: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    principal: Principal = Depends(get_principal),
+):
+    """A page of history, oldest first, ending just before the `before` cursor."""
+    conv = await db.conversations.find_one({"_id": conversation_id, "participants": principal.id})
+    if not conv:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    # Not migrated yet: move this conversation's history over on first access
+    if 'messages' in conv:
+        await move_embedded_messages(conv)
+    
+    query = {"conversationId": conversation_id}
+    if before:
+        values = decode_cursor(before)
+        if len(values) != 2:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query.update(keyset_after("timestamp", values[0], values[1]))
+    
+    docs = await db.messages.find(query).sort([("timestamp", -1), ("_id", -1)]).limit(limit).to_list(limit)
+    next_before = encode_cursor([docs[-1]['timestamp'], docs[-1]['_id']]) if len(docs) == limit else None
+    docs.reverse()
+    return {"messages": [message_out(d) for d in docs], "nextBefore": next_before}
+
+# Sync Routes
+# Writes racing a sync read can carry an updatedAt just before its token (and
+# other workers' clocks drift a little), so each sync re-reads this far back.
+# Clients merge by id, so the overlap only costs a few repeated entries.
+SYNC_OVERLAP_MS = 5000
+# Longest a GET /updates request may be parked; below common proxy idle timeouts
+LONG_POLL_MAX_SECONDS = 55
+# The users part of a sync is the same for every caller, and the long-polls one
+# broadcast wakes carry tokens from about the same moment (realtime.py spreads
+# those wake-ups over a second). Flooring the token to SYNC_USERS_BUCKET_MS lets
+# them share one query, reused for SYNC_USERS_TTL seconds; staying well under
+# SYNC_OVERLAP_MS means the next sync still re-reads anything a reused result missed.
+SYNC_USERS_BUCKET_MS = 5000
+SYNC_USERS_TTL = 1.0
+
+def parse_sync_token(since: str) -> int:
+    values = decode_cursor(since)
+    if len(values) != 1 or not isinstance(values[0], (int, float)):
+        raise HTTPException(status_code=400, detail="Invalid sync token")
+    return values[0]
+
+@single_flight("sync.users", ttl=SYNC_USERS_TTL)
+async def users_changed_since(floor_ms: Optional[int]) -> List[dict]:
+    """Users written at or after `floor_ms` (all of them for None); shared, don't mutate."""
+    query = {"updatedAt": {"$gte": floor_ms}} if floor_ms is not None else {}
+    users = await db.users.find(query, USER_PROJECTION).to_list(1000)
+    for u in users:
+        u['id'] = str(u['_id'])
+        del u['_id']
+    return users
+
+async def sync_payload(user_id: str, since: Optional[str]) -> dict:
+    """Users and conversation summaries changed since the `since` token (everything without one)."""
+    token = encode_cursor([now_ms()])
+    users_floor = None
+    conv_query = {"participants": user_id}
+    if since:
+        since_ms = parse_sync_token(since) - SYNC_OVERLAP_MS
+        users_floor = int(since_ms // SYNC_USERS_BUCKET_MS * SYNC_USERS_BUCKET_MS)
+        conv_query["updatedAt"] = {"$gte": since_ms}
+
+    users, conversations = await asyncio.gather(
+        users_changed_since(users_floor),
+        db.conversations.find(conv_query, CONVERSATION_META_PROJECTION).sort("lastMessageTime", -1).to_list(1000),
+    )
+    summaries = [conversation_summary(conv, user_id) for conv in conversations]
+    return {
+        "users": users,
+        "conversations": [c for c in summaries if c],
+        "token": token,
+        "full": not since,
+    }
+
+async def changed_since(user_id: str, since_ms: int) -> bool:
+    """Whether anything GET /sync would return for `user_id` was written at or after `since_ms`."""
+    user, conv = await asyncio.gather(
+        db.users.find_one({"updatedAt": {"$gte": since_ms}}, {"_id": 1}),
+        db.conversations.find_one({"participants": user_id, "updatedAt": {"$gte": since_ms}}, {"_id": 1}),
+    )
+    return bool(user or conv)
+
+@api.get("/sync")
+async def sync(since: Optional[str] = None, principal: Principal = Depends(get_principal)):
+    """Users and conversation summaries changed since the `since` token (everything without one)."""
+    return await sync_payload(principal.id, since)
+
+@api.get("/updates")
+async def wait_for_updates(
+    since: str,
+    timeout: float = Query(25, ge=0, le=LONG_POLL_MAX_SECONDS),
+    principal: Principal = Depends(get_principal),
+):
+    """Long-poll form of GET /sync: answers once something changed after `since`, 204 after `timeout` seconds.
+
+    The request is parked until an event reaches this user (a message in one
+    of their conversations, any user's profile/mode change); the answer is
+    the same payload /sync would give.
+    """
+    since_ms = parse_sync_token(since)
+    async with hub.park(principal.id) as wait:
+        if await changed_since(principal.id, since_ms):
+            counters.inc("long_poll_total", outcome="changed")
+        elif await wait(timeout):
+            counters.inc("long_poll_total", outcome="woken")
+        else:
+            counters.inc("long_poll_total", outcome="timeout")
+            return Response(status_code=status.HTTP_204_NO_CONTENT)
+    return await sync_payload(principal.id, since)
+
+# Only what start_chat's / send_message's availability checks look at
+TARGET_POLICY_PROJECTION = {"availabilityMode": 1, "availability": 1}
+
 @api.post("/conversations/start")
 async def start_chat(request: Request, payload: dict = Body(...), current_user: dict = Depends(get_current_user)):
     target_user_id = payload.get("userId")
     if not target_user_id:
         raise HTTPException(status_code=400, detail="userId required")
 
-    # Debug Logging
-    logger.info(f"Start Chat Request. User: {current_user['email']}, Target: {target_user_id}")
-    if target_user_id:
-        tgt = await db.users.find_one({"_id": target_user_id})
-        if tgt:
-            logger.info(f"Target Mode: {tgt.get('availabilityMode')}, Avail: {tgt.get('availability')}")
-            # Log Timezone Info
-            offset_h = request.headers.get('x-timezone-offset')
-            logger.info(f"Header Offset: {offset_h}")
-        
     # Check if exists
-    existing = await db.conversations.find_one({
-        "participants": {"$all": [current_user['id'], target_user_id]}
-    })
+    existing = await find_conversation(current_user['id'], target_user_id, {"_id": 1})
     
     if existing:
         return {"id": str(existing['_id']), "status": "exists"}
     
     # --- BLUE MODE LOGIC CHECK ---
     # Check if target user is in blue mode
-    target_user = await db.users.find_one({"_id": target_user_id})
+    target_user = await db.users.find_one({"_id": target_user_id}, TARGET_POLICY_PROJECTION)
+    logger.info(f"Start Chat Request. User: {current_user['email']}, Target: {target_user_id}, "
+                f"Mode: {target_user.get('availabilityMode') if target_user else None}")
     if target_user and target_user.get('availabilityMode') == 'blue':
         open_date_str = target_user.get('availability', {}).get('openDate')
         if open_date_str:
@@ -504,21 +1369,20 @@ async def start_chat(request: Request, payload: dict = Body(...), current_user:
     # This allows users to see the chat interface and understand the limit
     # -------------------------------
     
-    new_conv = {
-        "_id": str(uuid.uuid4()),
-        "participants": [current_user['id'], target_user_id],
-        "messages": [],
-        "created_at": datetime.now()
-    }
-    await db.conversations.insert_one(new_conv)
-    return {"id": new_conv['_id'], "status": "created"}
+    conv, created = await get_or_create_conversation(current_user['id'], target_user_id, {"_id": 1})
+    if created:
+        await publish_conversation("conversation.updated", conv)
+    return {"id": conv['_id'], "status": "created" if created else "exists"}
 
 @api.post("/conversations/{user_id}/messages")
 async def send_message(request: Request, user_id: str, payload: dict = Body(...), current_user: dict = Depends(get_current_user)):
     # user_id here is the TARGET user id
     
-    # Get target user first
-    target_user = await db.users.find_one({"_id": user_id})
+    # Target policy state and the conversation are independent reads; fetch both at once
+    target_user, conv = await asyncio.gather(
+        db.users.find_one({"_id": user_id}, TARGET_POLICY_PROJECTION),
+        find_conversation(current_user['id'], user_id, CONVERSATION_META_PROJECTION),
+    )
     
     # --- BLUE MODE CHECK (Before Sending) ---
     if target_user and target_user.get('availabilityMode') == 'blue':
@@ -553,41 +1417,23 @@ async def send_message(request: Request, user_id: str, payload: dict = Body(...)
     # ----------------------------------------
 
     # --- ORANGE MODE CHECK (Before Sending) ---
+    reserved_slot = False
     if target_user and target_user.get('availabilityMode') == 'orange':
-        # Check counts again (Active Session)
-        mode_start = target_user.get('availability', {}).get('modeStartedAt', 0)
-        
-        current = await db.conversations.count_documents({
-            "participants": user_id,
-            "messages": {"$not": {"$size": 0}},
-            "timerStarted": {"$gt": mode_start}
-        })
-        max_c = target_user.get('availability', {}).get('maxContact', 0)
-        
-        # Check if *this* conversation already has messages
-        my_conv = await db.conversations.find_one({
-            "participants": {"$all": [current_user['id'], user_id]}
-        })
-        
         # Determine if this message counts as a "New Contact" for this session
         # It is new if:
         # 1. No previous messages exist (New Conversation)
         # 2. Previous messages exist, BUT they are from BEFORE the mode started (Re-activating old chat)
-        
-        is_new_contact = False
-        if not my_conv or not my_conv.get('messages') or len(my_conv['messages']) == 0:
-            is_new_contact = True
-        else:
-            # Check timestamp of last activity vs mode_start
-            last_timer = my_conv.get('timerStarted', 0)
-            if last_timer <= mode_start:
-                is_new_contact = True
-            
-        if is_new_contact and current >= max_c:
-             raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="User has reached maximum contacts (Orange Mode)"
-             )
+        if counts_as_new_contact(conv, target_user):
+            # Check and take the slot in one atomic step (currentContacts < maxContact)
+            key = pair_key(current_user['id'], user_id)
+            reserved_slot = await reserve_orange_slot(user_id, key)
+            # A concurrent message of this same pair may have just taken the slot;
+            # that one still lets us through
+            if not reserved_slot and not await holds_orange_slot(user_id, key):
+                raise HTTPException(
+                    status_code=status.HTTP_403_FORBIDDEN,
+                    detail="User has reached maximum contacts (Orange Mode)"
+                )
     # ------------------------------------------
 
     # --- BROWN MODE CHECK (Before Sending) ---
@@ -596,95 +1442,158 @@ async def send_message(request: Request, user_id: str, payload: dict = Body(...)
         pass
     # ------------------------------------------
 
-    conv = await db.conversations.find_one({
-        "participants": {"$all": [current_user['id'], user_id]}
-    })
-    
-    if not conv:
-        # Auto-create?
-        conv_id = str(uuid.uuid4())
-        await db.conversations.insert_one({
-            "_id": conv_id,
-            "participants": [current_user['id'], user_id],
-            "messages": []
-        })
-        conv = {"_id": conv_id}
-
     text = payload.get("text")
     msg = Message(senderId=current_user['id'], text=text)
     msg_dump = msg.model_dump()
     
-    # Update conversation
+    # Update conversation (with the denormalized summary fields for the chat list)
     updates = {
-        "$push": {"messages": msg_dump},
+        "$inc": {"messageCount": 1},
+        "$set": {
+            "last": {k: msg_dump[k] for k in ("id", "senderId", "text", "timestamp")},
+            "lastMessageTime": msg_dump['timestamp'],
+        },
     }
     
     # Start timer if not started OR if we need to "renew" the session for Orange Mode counting
     # (i.e. if the timerStarted is OLDER than the modeStartedAt, we update it to NOW so it counts as 1 slot)
     should_update_timer = False
     
-    if not conv.get('timerStarted') or conv.get('rated') or conv.get('timerExpired'):
+    if not has_messages(conv) or not conv.get('timerStarted') or conv.get('rated') or conv.get('timerExpired'):
         should_update_timer = True
     elif target_user and target_user.get('availabilityMode') == 'orange':
-        mode_start = target_user.get('availability', {}).get('modeStartedAt', 0)
-        last_timer = conv.get('timerStarted', 0)
-        if last_timer <= mode_start:
+        if counts_as_new_contact(conv, target_user):
             should_update_timer = True
             
     if should_update_timer:
-         updates["$set"] = {"timerStarted": datetime.now().timestamp() * 1000, "rated": False, "timerExpired": False}
+         updates["$set"].update({"timerStarted": datetime.now().timestamp() * 1000, "rated": False, "timerExpired": False})
+    updates = with_version(updates)
+
+    # --- ORANGE MODE CONTACT COUNTER ---
+    # A restarted timer makes the conversation active in every Orange session that
+    # began before it; bump the stored counter of each participant it newly counts for.
+    # (The target's slot, if any, was already taken by reserve_orange_slot.)
+    counted = [(user_id, target_user)] if reserved_slot else []
+    counter_writes = []
+    if should_update_timer:
+        for participant_id, participant in ((user_id, target_user), (current_user['id'], current_user)):
+            if participant_id == user_id and reserved_slot:
+                continue
+            if participant and participant.get('availabilityMode') == 'orange' and counts_as_new_contact(conv, participant):
+                counted.append((participant_id, participant))
+                counter_writes.append(db.users.update_one(
+                    {"_id": participant_id},
+                    with_version({
+                        "$inc": {"availability.currentContacts": 1},
+                        "$addToSet": {"orangeContactKeys": pair_key(current_user['id'], user_id)},
+                    })
+                ))
+    # -----------------------------------
     
-    await db.conversations.update_one(
-        {"_id": conv["_id"]},
-        updates
-    )
+    if conv:
+        # Known conversation: every write goes out in one round. When a counter was
+        # bumped, read back the prior state to detect a concurrent first message.
+        if counted:
+            conv_write = db.conversations.find_one_and_update(
+                {"_id": conv["_id"]}, updates, projection=CONVERSATION_META_PROJECTION,
+                return_document=ReturnDocument.BEFORE
+            )
+        else:
+            conv_write = db.conversations.update_one({"_id": conv["_id"]}, updates)
+        result, *_ = await asyncio.gather(
+            conv_write,
+            db.messages.insert_one(message_doc(conv['_id'], msg_dump)),
+            *counter_writes
+        )
+        before = result if counted else conv
+        clocks = [conversation_written(conv['participants'])]
+    else:
+        # Auto-create if the chat was never started; the upsert applies the update
+        # too (and advances the conversation clocks)
+        before, _ = await get_or_create_conversation(
+            current_user['id'], user_id, CONVERSATION_META_PROJECTION, updates
+        )
+        await asyncio.gather(
+            db.messages.insert_one(message_doc(before['_id'], msg_dump)),
+            *counter_writes
+        )
+        clocks = []
+
+    async def settle_counter(participant_id: str, participant: dict):
+        # A concurrent message of this same pair activated the conversation first and
+        # already holds the slot: give ours back so it is counted once
+        if not counts_as_new_contact(before, participant):
+            await release_orange_slot(participant_id)
+        # Their profiles show the contact counter; invalidated once it is final
+        await user_written(participant_id)
+    
+    # The clocks and the counters' follow-ups go out in one round
+    await asyncio.gather(*clocks, *[settle_counter(participant_id, participant) for participant_id, participant in counted])
+    
+    # Push to both sides; the summary is the prior state with this send applied
+    after = {**before, **updates["$set"], "messageCount": before.get("messageCount", 0) + 1}
+    await publish_conversation("message.created", after, {"message": msg_dump})
     
     return msg_dump
 
 @api.post("/conversations/{user_id}/rate")
-async def rate_conversation(user_id: str, payload: dict = Body(...), current_user: dict = Depends(get_current_user)):
+async def rate_conversation(user_id: str, payload: dict = Body(...), principal: Principal = Depends(get_principal)):
     is_good = payload.get("isGood")
     reason = payload.get("reason")
     
-    conv = await db.conversations.find_one({
-        "participants": {"$all": [current_user['id'], user_id]}
-    })
+    async def rate():
+        return await db.conversations.find_one_and_update(
+            {"pairKey": pair_key(principal.id, user_id)},
+            with_version({
+                "$set": {
+                    "rated": True,
+                    "timerExpired": True,
+                    "ratingType": "good" if is_good else "bad",
+                    "ratingReason": reason
+                }
+            }),
+            projection=CONVERSATION_META_PROJECTION,
+            return_document=ReturnDocument.AFTER
+        )
+    
+    conv = await rate()
+    # Not keyed yet (see key_legacy_conversation)
+    if not conv and await key_legacy_conversation(principal.id, user_id, {"_id": 1}):
+        conv = await rate()
     
     if not conv:
         raise HTTPException(status_code=404, detail="Conversation not found")
-        
-    await db.conversations.update_one(
-        {"_id": conv["_id"]},
-        {
-            "$set": {
-                "rated": True,
-                "timerExpired": True,
-                "ratingType": "good" if is_good else "bad",
-                "ratingReason": reason
-            }
-        }
-    )
+    await conversation_written(conv['participants'])
+    await publish_conversation("conversation.updated", conv)
     
     # Update user approval rating
-    target_user = await db.users.find_one({"_id": user_id})
-    if target_user:
-        if is_good:
-            change = 10
-        else:
-            penalties = {
-                'No response / Ghosted': -15,
-                'Rude or disrespectful': -20,
-                'Spam messages': -25,
-                'Inappropriate content': -30,
-                'One-word answers': -10
-            }
-            change = penalties.get(reason, -10)
+    if is_good:
+        change = 10
+    else:
+        penalties = {
+            'No response / Ghosted': -15,
+            'Rude or disrespectful': -20,
+            'Spam messages': -25,
+            'Inappropriate content': -30,
+            'One-word answers': -10
+        }
+        change = penalties.get(reason, -10)
 
-        # Update rating
-        await db.users.update_one(
-            {"_id": user_id},
-            {"$inc": {"approvalRating": change}}
-        )
+    # Update rating
+    target_user = await db.users.find_one_and_update(
+        {"_id": user_id},
+        with_version({"$inc": {"approvalRating": change}}),
+        projection={"approvalRating": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if target_user:
+        await user_written(user_id)
+        await hub.broadcast("rating.applied", {
+            "userId": user_id,
+            "conversationId": conv['_id'],
+            "change": change,
+            "approvalRating": target_user.get('approvalRating'),
+        })
         
         # Note: Do NOT decrement currentContacts.
         # This ensures the slot remains "used" even after rating, 
@@ -692,15 +1601,100 @@ async def rate_conversation(user_id: str, payload: dict = Body(...), current_use
 
     return {"status": "success"}
 
+# Admin Routes
+def require_profile_admin(token: str = ""):
+    """Same signed token as the X-Profile header, passed as ?token= so profiles open in a browser."""
+    if not verify_token(token, PROFILE_SECRET):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not allowed")
+
+@api.get("/admin/profiles", dependencies=[Depends(require_profile_admin)])
+async def get_profiles():
+    return {"profiles": list_profiles(PROFILE_DIR)}
+
+@api.get("/admin/profiles/{profile_id}", dependencies=[Depends(require_profile_admin)])
+async def get_profile(profile_id: str):
+    path = profile_path(PROFILE_DIR, profile_id)
+    if not path:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/html" if path.suffix == ".html" else "text/plain")
+
+# Realtime Routes
+@api.websocket("/ws")
+async def websocket_events(websocket: WebSocket, token: str = ""):
+    """Server push of message/conversation/user events; browsers can't set headers, so the JWT comes as ?token=."""
+    try:
+        user = await user_from_token(token)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    await hub.serve(websocket, user['id'])
+
+@api.get("/events")
+async def event_stream(request: Request, token: str = "", lastEventId: Optional[str] = None):
+    """The websocket's events as text/event-stream, for clients whose proxies drop websocket upgrades.
+
+    EventSource can't set headers, so the JWT may come as ?token=; it resends
+    the last id it saw as Last-Event-ID when reconnecting (?lastEventId= does
+    the same for a stream reopened by hand), and the events missed meanwhile
+    are replayed.
+    """
+    authorization = request.headers.get("authorization", "")
+    user = await user_from_token(token or authorization.removeprefix("Bearer ").strip())
+    last_event_id = request.headers.get("last-event-id") or lastEventId
+    return StreamingResponse(
+        hub.stream(user['id'], last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 app.include_router(api)
 
+# Prometheus scrape endpoint; outside /api, so the ingress that routes /api here doesn't expose it
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+# Per-worker counters as JSON; outside /api for the same reason as /metrics
+@app.get("/stats", include_in_schema=False)
+async def get_stats():
+    """Counters of this worker since it started."""
+    tagged = counters.by_label("etag_requests_total", "route")
+    hits = counters.by_label("etag_not_modified_total", "route")
+    total = sum(tagged.values())
+    return {
+        "etag": {
+            "requests": total,
+            "notModified": sum(hits.values()),
+            "hitRatio": ratio(sum(hits.values()), total),
+            "routes": {
+                route: {"requests": n, "notModified": hits.get(route, 0), "hitRatio": ratio(hits.get(route, 0), n)}
+                for route, n in tagged.items()
+            },
+        },
+        "caches": {name: c.stats() for name, c in CACHES.items()},
+        "coalescing": {name: f.stats() for name, f in FLIGHTS.items()},
+        "db": route_stats(),
+        "executors": {
+            password_pool.name: {
+                "workers": password_pool.workers,
+                "inFlight": password_pool.in_flight,
+                "queueDepth": password_pool.queue_depth,
+                "rejected": counters.get("executor_rejected_total", executor=password_pool.name),
+            },
+        },
+    }
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Request-ID", "X-Profile-Id"],
 )
+app.add_middleware(ProfilingMiddleware, secret=PROFILE_SECRET, directory=PROFILE_DIR, keep=PROFILE_KEEP)
+app.add_middleware(RequestTracingMiddleware, max_commands=TRACE_MAX_COMMANDS, repeat_limit=TRACE_REPEAT_LIMIT)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,104 @@
+"""Check that SingleFlight coalesces concurrent calls and shares their errors.
+
+Runs in process, no database needed.
+
+    python test_coalesce.py
+"""
+
+import sys
+import asyncio
+
+from coalesce import SingleFlight, single_flight
+
+async def run() -> int:
+    failures = []
+
+    def check(ok: bool, what: str):
+        print(f"  {'ok' if ok else 'FAILED'}: {what}")
+        if not ok:
+            failures.append(what)
+
+    flight = SingleFlight("test.flight")
+    calls = []
+    release = asyncio.Event()
+
+    async def load(key):
+        calls.append(key)
+        await release.wait()
+        return {"key": key}
+
+    # Concurrent calls with the same key share one execution and its result
+    waiters = [asyncio.ensure_future(flight.run("a", lambda: load("a"))) for _ in range(10)]
+    other = asyncio.ensure_future(flight.run("b", lambda: load("b")))
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*waiters)
+    check(calls.count("a") == 1, "ten concurrent calls run once")
+    check(all(r is results[0] for r in results), "every caller gets the same result")
+    check(await other == {"key": "b"} and calls.count("b") == 1, "a different key runs on its own")
+
+    # Without a ttl, a call after completion runs again
+    await flight.run("a", lambda: load("a"))
+    check(calls.count("a") == 2, "a later call runs again without a ttl")
+
+    # An error reaches every caller, and isn't kept
+    attempts = []
+    gate = asyncio.Event()
+
+    async def broken():
+        attempts.append(1)
+        await gate.wait()
+        raise ValueError("boom")
+
+    failing = SingleFlight("test.flight.errors", ttl=60)
+    waiters = [asyncio.ensure_future(failing.run("k", broken)) for _ in range(5)]
+    await asyncio.sleep(0)
+    gate.set()
+    outcomes = await asyncio.gather(*waiters, return_exceptions=True)
+    check(len(attempts) == 1, "failing concurrent calls run once")
+    check(all(isinstance(o, ValueError) for o in outcomes), "the error is raised to every caller")
+    try:
+        await failing.run("k", broken)
+        raised = False
+    except ValueError:
+        raised = True
+    check(raised and len(attempts) == 2, "an error isn't cached, the next call runs again")
+
+    # One caller going away doesn't cancel the shared work
+    finish = asyncio.Event()
+
+    async def slow():
+        await finish.wait()
+        return "done"
+
+    shared = SingleFlight("test.flight.cancel")
+    first = asyncio.ensure_future(shared.run("k", slow))
+    second = asyncio.ensure_future(shared.run("k", slow))
+    await asyncio.sleep(0)
+    first.cancel()
+    finish.set()
+    check(await second == "done", "cancelling one caller leaves the others their result")
+
+    # With a ttl, a completed result is reused
+    cached_calls = []
+
+    @single_flight("test.flight.decorated", ttl=60)
+    async def lookup(user_id: str, full: bool = False):
+        cached_calls.append(user_id)
+        return user_id
+
+    await lookup("u1")
+    await lookup("u1")
+    await lookup("u1", full=True)
+    check(cached_calls == ["u1", "u1"], "the decorator reuses results within the ttl, keyed by arguments")
+    stats = lookup.flight.stats()
+    check(stats["executed"] == 2 and stats["cached"] == 1, "stats count executed and cached calls")
+
+    if failures:
+        print(f"FAILURE: {len(failures)} checks failed")
+        return 1
+    print("SUCCESS: concurrent calls coalesce and share their errors.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(run()))
@@ -0,0 +1,73 @@
+import sys
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_URL = "http://localhost:8001/api"
+
+SENDERS = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+MAX_CONTACT = 5
+
+def create_user(email, name):
+    resp = requests.post(f"{BASE_URL}/auth/signup", json={
+        "email": email, "password": "password", "name": name
+    })
+    return resp.json()['access_token'], resp.json()['user']['id']
+
+def set_orange(token, user_id, max_c):
+    requests.put(f"{BASE_URL}/users/{user_id}", headers={"Authorization": f"Bearer {token}"}, json={
+        "availabilityMode": "orange",
+        "availability": {"maxContact": max_c}
+    })
+
+def send_message(token, target_id, text):
+    resp = requests.post(f"{BASE_URL}/conversations/{target_id}/messages", headers={"Authorization": f"Bearer {token}"}, json={"text": text})
+    return resp.status_code
+
+def current_contacts(user_id):
+    resp = requests.get(f"{BASE_URL}/users/{user_id}")
+    return resp.json()['availability'].get('currentContacts', 0)
+
+def burst(pool, token_target_pairs, text):
+    return list(pool.map(lambda pair: send_message(pair[0], pair[1], text), token_target_pairs))
+
+def run_test():
+    print(f"Running Orange Mode Concurrency Test ({SENDERS} senders, maxContact={MAX_CONTACT})...")
+    ts = int(time.time())
+    failures = []
+
+    token_o, id_o = create_user(f"orange_race_{ts}@test.com", "Orange Race")
+    set_orange(token_o, id_o, MAX_CONTACT)
+
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        senders = list(pool.map(
+            lambda i: create_user(f"race{i}_{ts}@test.com", f"Racer {i}"), range(SENDERS)
+        ))
+
+    # 1. Every sender's first message at once: exactly MAX_CONTACT may get through
+    with ThreadPoolExecutor(max_workers=SENDERS) as pool:
+        codes = burst(pool, [(token, id_o) for token, _ in senders], "First msg")
+    accepted = codes.count(200)
+    denied = codes.count(403)
+    stored = current_contacts(id_o)
+    print(f"Distinct senders: {accepted} accepted, {denied} denied, currentContacts={stored}")
+    if accepted != MAX_CONTACT or denied != SENDERS - MAX_CONTACT or stored != MAX_CONTACT:
+        failures.append("distinct senders overshot or undershot the limit")
+
+    # 2. One sender racing itself to a fresh Orange user: a single slot, no denials
+    token_o2, id_o2 = create_user(f"orange_race2_{ts}@test.com", "Orange Race 2")
+    set_orange(token_o2, id_o2, MAX_CONTACT)
+    with ThreadPoolExecutor(max_workers=20) as pool:
+        codes = burst(pool, [(senders[0][0], id_o2)] * 20, "Same pair")
+    stored = current_contacts(id_o2)
+    print(f"Same pair: {codes.count(200)}/20 accepted, currentContacts={stored}")
+    if codes.count(200) != 20 or stored != 1:
+        failures.append("same-pair burst was not counted exactly once")
+
+    if failures:
+        print("FAILURE: " + "; ".join(failures))
+        sys.exit(1)
+    print("SUCCESS: Orange limit held under concurrency.")
+
+if __name__ == "__main__":
+    run_test()
@@ -0,0 +1,69 @@
+"""Check that MemoryProfileCache never keeps a profile read before its invalidation.
+
+A reader takes generation() before reading the database and passes it to
+set(); an invalidate() of the key in between must drop that fill. Runs in
+process, no database needed.
+
+    python test_profile_cache.py
+"""
+
+import sys
+import asyncio
+
+from cache import MemoryProfileCache
+
+async def run() -> int:
+    failures = []
+
+    def check(ok: bool, what: str):
+        print(f"  {'ok' if ok else 'FAILED'}: {what}")
+        if not ok:
+            failures.append(what)
+
+    cache = MemoryProfileCache("test.profiles", 1024 * 1024, 60)
+
+    # A fill racing an invalidate of its key: read v1, the write lands, then the fill completes
+    generation = cache.generation("alice")
+    cache.invalidate("alice")
+    await cache.set("alice", 1, b"v1", generation)
+    check(await cache.get("alice") is None, "a fill started before an invalidate is dropped")
+
+    generation = cache.generation("alice")
+    await cache.set("alice", 2, b"v2", generation)
+    check(await cache.get("alice") == (2, b"v2"), "a fill started after the invalidate is kept")
+
+    # Invalidating one key leaves fills of other keys alone
+    generation = cache.generation("bob")
+    cache.invalidate("carol")
+    await cache.set("bob", 1, b"bob", generation)
+    check(await cache.get("bob") == (1, b"bob"), "an invalidate of another key doesn't drop a fill")
+
+    # An invalidate removes what is cached
+    cache.invalidate("bob")
+    check(await cache.get("bob") is None, "invalidate drops the cached entry")
+
+    # Past max_tombstones the per-key records are forgotten: every fill from before is stale
+    small = MemoryProfileCache("test.profiles.small", 1024 * 1024, 60, max_tombstones=2)
+    generation = small.generation("dave")
+    for key in ("k1", "k2", "k3"):
+        small.invalidate(key)
+    await small.set("dave", 1, b"dave", generation)
+    check(await small.get("dave") is None, "fills from before a tombstone overflow are dropped")
+    await small.set("dave", 1, b"dave", small.generation("dave"))
+    check(await small.get("dave") == (1, b"dave"), "fills after a tombstone overflow are kept")
+    check(small.stats()["staleSets"] >= 1, "dropped fills are counted")
+
+    # Bounded by bytes, least recently used first
+    tiny = MemoryProfileCache("test.profiles.tiny", 2 * (100 + 200), 60)
+    for key in ("a", "b", "c"):
+        await tiny.set(key, 1, b"x" * 100, tiny.generation(key))
+    check(await tiny.get("a") is None and await tiny.get("c") is not None, "the oldest entry is evicted past max_bytes")
+
+    if failures:
+        print(f"FAILURE: {len(failures)} checks failed")
+        return 1
+    print("SUCCESS: profile cache fills respect invalidations.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(run()))
@@ -0,0 +1,156 @@
+"""Check that no endpoint query needs a collection scan.
+
+Runs the app in-process (httpx ASGI transport) against a scratch database on a
+local mongod, with the startup index registry applied, and exercises the API
+the way the frontend does. Every find/count/aggregate/update/delete/findAndModify
+it issues is captured with pymongo command monitoring and re-run through
+explain(); any winning plan containing a COLLSCAN fails the run.
+
+Full listings (a find with an empty filter, e.g. the unpaginated GET /users)
+read every document by design and are reported but not failed.
+
+    python test_query_plans.py
+"""
+
+import os
+import sys
+import json
+import asyncio
+
+import httpx
+from pymongo import monitoring
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import server
+from media import MediaStore
+
+PLAN_DB_NAME = os.environ.get('PLAN_DB_NAME', 'aviato_query_plans')
+
+EXPLAINABLE = {"find", "count", "aggregate", "distinct", "update", "delete", "findAndModify"}
+# Session/cluster bookkeeping that explain doesn't accept
+DROP_FIELDS = {"lsid", "txnNumber", "$db", "$clusterTime", "$readPreference", "autocommit", "startTransaction"}
+
+class CommandRecorder(monitoring.CommandListener):
+    def __init__(self):
+        self.commands = []
+
+    def started(self, event):
+        if event.command_name in EXPLAINABLE and event.database_name == PLAN_DB_NAME:
+            self.commands.append({k: v for k, v in event.command.items() if k not in DROP_FIELDS})
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+def winning_plans(explain):
+    """The chosen plan(s) of an explain result, wherever the command nests them."""
+    if isinstance(explain, dict):
+        for key, value in explain.items():
+            if key == "winningPlan":
+                yield value
+            elif key != "rejectedPlans":
+                yield from winning_plans(value)
+    elif isinstance(explain, list):
+        for item in explain:
+            yield from winning_plans(item)
+
+def plan_stages(plan):
+    """Every stage name in an explain plan tree."""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from plan_stages(item)
+
+def is_full_listing(command):
+    return command.get("find") is not None and not command.get("filter")
+
+def describe(command):
+    name = next(iter(command))
+    shape = {k: command[k] for k in ("filter", "query", "q", "sort", "pipeline", "updates", "deletes") if k in command}
+    return f"{name} {command[name]} {json.dumps(shape, default=str)[:300]}"
+
+async def exercise(http):
+    """Drive the endpoints the frontend uses."""
+    async def signup(name):
+        r = await http.post("/api/auth/signup", json={"email": f"{name}@plans.example.com", "password": "pass", "name": name})
+        r.raise_for_status()
+        data = r.json()
+        return {"Authorization": f"Bearer {data['access_token']}"}, data['user']['id']
+
+    alice_h, alice = await signup("alice")
+    bob_h, bob = await signup("bob")
+    (await http.post("/api/auth/login", data={"username": "alice@plans.example.com", "password": "pass"})).raise_for_status()
+
+    await http.put(f"/api/users/{bob}", headers=bob_h, json={"availabilityMode": "orange", "availability": {"maxContact": 3}})
+    await http.get("/api/auth/me", headers=alice_h)
+    await http.get("/api/users")
+    for sort in ("approvalRating", "reviewRating", "recent"):
+        page = (await http.get("/api/users", params={"limit": 1, "sort": sort})).json()
+        await http.get("/api/users", params={"limit": 1, "sort": sort, "after": page["nextCursor"]})
+    await http.get(f"/api/users/{bob}")
+
+    conv = (await http.post("/api/conversations/start", headers=alice_h, json={"userId": bob})).json()
+    for i in range(3):
+        (await http.post(f"/api/conversations/{bob}/messages", headers=alice_h, json={"text": f"hi {i}"})).raise_for_status()
+    (await http.post(f"/api/conversations/{alice}/messages", headers=bob_h, json={"text": "hello"})).raise_for_status()
+    await http.get("/api/conversations", headers=alice_h)
+    page = (await http.get(f"/api/conversations/{conv['id']}/messages", headers=alice_h, params={"limit": 2})).json()
+    await http.get(f"/api/conversations/{conv['id']}/messages", headers=alice_h, params={"limit": 2, "before": page["nextBefore"]})
+    # A conversation from before pair keys is keyed on first access
+    carol_h, carol = await signup("carol")
+    await server.db.conversations.insert_one({"_id": "legacy", "participants": [carol, alice], "messageCount": 0})
+    (await http.post(f"/api/conversations/{alice}/messages", headers=carol_h, json={"text": "still here"})).raise_for_status()
+    sync = (await http.get("/api/sync", headers=bob_h)).json()
+    await http.get("/api/sync", headers=bob_h, params={"since": sync["token"]})
+
+    await http.post(f"/api/conversations/{bob}/rate", headers=alice_h, json={"isGood": True})
+    await http.post(f"/api/users/{bob}/reviews", headers=alice_h, json={
+        "raterId": alice, "raterName": "alice", "rating": 5, "timestamp": 0
+    })
+    page = (await http.get(f"/api/users/{bob}/reviews", params={"limit": 1})).json()
+    await http.get(f"/api/users/{bob}/reviews", params={"limit": 1, "before": page["nextBefore"]})
+    await http.get("/api/reviews/given", headers=alice_h)
+
+async def run() -> int:
+    recorder = CommandRecorder()
+    server.client = AsyncIOMotorClient(server.MONGO_URL, event_listeners=[recorder])
+    server.db = server.client[PLAN_DB_NAME]
+    server.media = MediaStore(server.db)
+    await server.client.drop_database(PLAN_DB_NAME)
+    await server.ensure_indexes()
+
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://plans") as http:
+        await exercise(http)
+
+    scans, listings, seen = [], [], set()
+    for command in recorder.commands:
+        key = describe(command)
+        if key in seen:
+            continue
+        seen.add(key)
+        explain = await server.db.command({"explain": command, "verbosity": "queryPlanner"})
+        if "COLLSCAN" in set(plan_stages(list(winning_plans(explain)))):
+            (listings if is_full_listing(command) else scans).append(key)
+
+    await server.client.drop_database(PLAN_DB_NAME)
+
+    print(f"Explained {len(seen)} distinct queries")
+    for key in listings:
+        print(f"  full listing (allowed): {key}")
+    for key in scans:
+        print(f"  COLLSCAN: {key}")
+    if scans:
+        print(f"FAILURE: {len(scans)} queries scan a whole collection")
+        return 1
+    print("SUCCESS: every query uses an index.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(run()))
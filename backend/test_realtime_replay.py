@@ -0,0 +1,90 @@
+"""Check that event streams resume from Last-Event-ID, or resync when they can't.
+
+Drives Hub.stream directly on an in-memory bus: a fresh stream, a resume
+within the grace period, a resume past the replay floor, a resume after the
+log expired, and an id from another process. Runs in process, no database
+needed.
+
+    python test_realtime_replay.py
+"""
+
+import sys
+import asyncio
+
+from realtime import Hub
+
+def event_id(chunk: str) -> str:
+    return chunk.split("\n")[0][len("id: "):]
+
+async def next_chunk(stream, timeout: float = 1.0) -> str:
+    return await asyncio.wait_for(stream.__anext__(), timeout)
+
+async def open_stream(hub: Hub, user_id: str, last_event_id=None):
+    """A stream with its retry: line consumed, and its first event (ready, resync or a
+    replayed one; empty if a resume had nothing to replay)."""
+    stream = hub.stream(user_id, last_event_id)
+    await next_chunk(stream)
+    try:
+        return stream, await next_chunk(stream, 0.2)
+    except asyncio.TimeoutError:
+        return stream, ""
+
+async def run() -> int:
+    failures = []
+
+    def check(ok: bool, what: str):
+        print(f"  {'ok' if ok else 'FAILED'}: {what}")
+        if not ok:
+            failures.append(what)
+
+    hub = Hub(heartbeat=5, replay_size=3, replay_grace=0.2)
+
+    stream, first = await open_stream(hub, "alice")
+    check('"ready"' in first, "a fresh stream starts with ready")
+    await hub.publish(["alice"], "message.created", {"n": 1})
+    await hub.publish(["bob"], "message.created", {"n": "bob's"})
+    live = await next_chunk(stream)
+    check('"n": 1' in live, "live events are delivered, other users' are not")
+    last = event_id(live)
+    await stream.aclose()
+
+    # Within the grace period the channel stays subscribed and recorded
+    await hub.publish(["alice"], "message.created", {"n": 2})
+    await hub.broadcast("user.updated", {"n": 3})
+    stream, first = await open_stream(hub, "alice", last)
+    second = await next_chunk(stream)
+    check('"n": 2' in first and '"n": 3' in second, "a resume replays missed user events and broadcasts in order")
+    last = event_id(second)
+    await stream.aclose()
+
+    # More missed events than the log keeps: the floor is past the client's id
+    for n in range(4, 8):
+        await hub.publish(["alice"], "message.created", {"n": n})
+    stream, first = await open_stream(hub, "alice", last)
+    check('"resync"' in first, "a resume past the replay floor resyncs")
+    await stream.aclose()
+
+    # An id from another process (or before a restart)
+    stream, first = await open_stream(hub, "alice", "deadbeef-1")
+    check('"resync"' in first, "an id from another epoch resyncs")
+    last = event_id(first)
+    await stream.aclose()
+
+    # After the grace period the channel is unsubscribed and the log dropped;
+    # events published meanwhile never reach this worker
+    await asyncio.sleep(0.4)
+    check("alice" not in hub._replay, "the log is dropped after the grace period")
+    await hub.publish(["alice"], "message.created", {"n": "lost"})
+    stream, first = await open_stream(hub, "alice", last)
+    check('"resync"' in first, "a resume after the log expired resyncs")
+    await stream.aclose()
+
+    await asyncio.sleep(0.4)
+    if failures:
+        print(f"FAILURE: {len(failures)} checks failed")
+        return 1
+    print("SUCCESS: streams resume or resync.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(run()))
@@ -0,0 +1,272 @@
+import time
+import uuid
+import asyncio
+import logging
+import threading
+import weakref
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any, Dict, Optional, Tuple
+
+from pymongo import monitoring
+
+from metrics import counters, ratio, Histogram
+
+logger = logging.getLogger(__name__)
+
+# Commands whose payload is bookkeeping rather than a query of ours
+IGNORED_COMMANDS = {"hello", "ismaster", "isMaster", "ping", "endSessions", "saslStart", "saslContinue", "buildInfo"}
+# Where each command keeps the filter that identifies its query shape
+FILTER_FIELDS = ("filter", "query", "q")
+
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "Time to complete an HTTP request, by route.")
+POOL_WAIT_SECONDS = Histogram(
+    "mongo_pool_checkout_wait_seconds", "Time spent waiting for a Mongo connection from the pool.",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0),
+)
+
+class RequestTrace:
+    """Database work done on behalf of one HTTP request."""
+
+    def __init__(self, method: str, path: str, request_id: str, scope: Optional[dict] = None):
+        self.method = method
+        self.path = path
+        self.scope = scope or {}
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.commands = 0
+        self.db_ms = 0.0
+        self.collections: Counter = Counter()
+        self.shapes: Counter = Counter()
+        self.finished = False
+        # Motor runs commands on its thread pool; a gather() may run several at once
+        self._lock = threading.Lock()
+
+    def record(self, collection: str, shape: Tuple, duration_ms: float):
+        with self._lock:
+            if self.finished:
+                return
+            self.commands += 1
+            self.db_ms += duration_ms
+            if collection:
+                self.collections[collection] += 1
+            self.shapes[shape] += 1
+
+    @property
+    def route(self) -> str:
+        """The matched route template (bounded cardinality), once routing has run."""
+        return getattr(self.scope.get("route"), "path", None) or "unmatched"
+
+    @property
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def repeated(self) -> Optional[Tuple[Tuple, int]]:
+        """The most repeated query shape, if any shape ran more than once."""
+        if not self.shapes:
+            return None
+        shape, n = self.shapes.most_common(1)[0]
+        return (shape, n) if n > 1 else None
+
+_current: ContextVar[Optional[RequestTrace]] = ContextVar("request_trace", default=None)
+# The same traces by the task serving them, for code outside that task (the loop watchdog thread)
+_by_task: "weakref.WeakKeyDictionary[asyncio.Task, RequestTrace]" = weakref.WeakKeyDictionary()
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current.get()
+
+def trace_of_task(task: asyncio.Task) -> Optional[RequestTrace]:
+    return _by_task.get(task)
+
+def value_shape(value: Any) -> Any:
+    """A filter with its values blanked out, keeping field names and operators."""
+    if isinstance(value, dict):
+        return tuple(sorted((k, value_shape(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)) and value and all(isinstance(v, dict) for v in value):
+        return tuple(value_shape(v) for v in value)
+    return "?"
+
+def command_shape(command_name: str, command: dict) -> Tuple[str, Tuple]:
+    """(collection, shape) of a command; same shape means same query with other values."""
+    collection = command.get(command_name)
+    collection = collection if isinstance(collection, str) else ""
+    target = command
+    for batch in ("updates", "deletes"):
+        if command.get(batch):
+            target = command[batch][0]
+    filt = next((target[f] for f in FILTER_FIELDS if f in target), None)
+    if filt is None and command.get("pipeline"):
+        filt = command["pipeline"][0].get("$match")
+    return collection, (command_name, collection, value_shape(filt or {}))
+
+class CommandTracer(monitoring.CommandListener):
+    """Attributes every Mongo command to the request (contextvar) that issued it.
+
+    Motor copies the caller's context into its executor threads, so the
+    listener, which pymongo calls on those threads, sees the request's trace.
+    """
+
+    def __init__(self):
+        self._pending: Dict[Tuple[Any, int], Tuple[RequestTrace, str, Tuple]] = {}
+
+    def started(self, event):
+        trace = _current.get()
+        if trace is None or event.command_name in IGNORED_COMMANDS:
+            return
+        collection, shape = command_shape(event.command_name, event.command)
+        self._pending[(event.connection_id, event.request_id)] = (trace, collection, shape)
+
+    def _finish(self, event):
+        pending = self._pending.pop((event.connection_id, event.request_id), None)
+        if pending:
+            trace, collection, shape = pending
+            trace.record(collection, shape, event.duration_micros / 1000)
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event)
+
+class PoolWaitTimer(monitoring.ConnectionPoolListener):
+    """Observes how long each connection checkout waited on the pool.
+
+    pymongo reports the start and the end of a checkout on the thread that
+    asks for the connection, and their events carry no duration of their own.
+    """
+
+    def __init__(self):
+        self._started: Dict[Tuple[Any, int], float] = {}
+
+    def connection_check_out_started(self, event):
+        self._started[(event.address, threading.get_ident())] = time.perf_counter()
+
+    def _checkout_done(self, event):
+        started = self._started.pop((event.address, threading.get_ident()), None)
+        if started is not None:
+            POOL_WAIT_SECONDS.observe(time.perf_counter() - started)
+
+    def connection_checked_out(self, event):
+        self._checkout_done(event)
+
+    def connection_check_out_failed(self, event):
+        self._checkout_done(event)
+
+    def connection_checked_in(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+def server_timing(trace: RequestTrace) -> str:
+    return (
+        f'db;dur={trace.db_ms:.1f};desc="{trace.commands} commands", '
+        f'app;dur={trace.elapsed_ms:.1f}'
+    )
+
+class RequestTracingMiddleware:
+    """ASGI middleware: per-request Mongo command count/time in Server-Timing and the logs.
+
+    A request issuing more than `max_commands` commands, or the same query
+    shape more than `repeat_limit` times (an N+1 loop), is logged as a warning.
+    Totals per route are kept for GET /stats; route latency and status
+    codes are recorded for /metrics.
+    """
+
+    def __init__(self, app, max_commands: int = 20, repeat_limit: int = 5):
+        self.app = app
+        self.max_commands = max_commands
+        self.repeat_limit = repeat_limit
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        request_id = headers.get(b"x-request-id", b"").decode("latin-1")[:64] or uuid.uuid4().hex
+        trace = RequestTrace(scope["method"], scope["path"], request_id, scope)
+        token = _current.set(trace)
+        task = asyncio.current_task()
+        _by_task[task] = trace
+        status_code = 500
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [
+                    (b"server-timing", server_timing(trace).encode("latin-1")),
+                    (b"x-request-id", request_id.encode("latin-1")),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            _by_task.pop(task, None)
+            self.finish(trace, status_code)
+
+    def finish(self, trace: RequestTrace, status_code: int):
+        with trace._lock:
+            trace.finished = True
+        label = f"{trace.method} {trace.route}"
+        REQUEST_SECONDS.observe(trace.elapsed_ms / 1000, method=trace.method, route=trace.route)
+        counters.inc("http_requests_total", method=trace.method, route=trace.route, status=str(status_code))
+        counters.inc("db_traced_requests_total", route=label)
+        counters.inc("db_commands_total", trace.commands, route=label)
+        counters.inc("db_time_seconds_total", trace.db_ms / 1000, route=label)
+
+        collections = ",".join(sorted(trace.collections)) or "-"
+        logger.info(
+            f"{trace.method} {trace.path} {status_code} {trace.elapsed_ms:.1f}ms "
+            f"db={trace.commands}/{trace.db_ms:.1f}ms [{collections}] id={trace.request_id}"
+        )
+
+        if trace.commands > self.max_commands:
+            counters.inc("db_trace_warnings_total", route=label, kind="commands")
+            logger.warning(f"{label} issued {trace.commands} Mongo commands (limit {self.max_commands}) id={trace.request_id}")
+        repeated = trace.repeated()
+        if repeated and repeated[1] > self.repeat_limit:
+            shape, n = repeated
+            counters.inc("db_trace_warnings_total", route=label, kind="repeated")
+            logger.warning(f"{label} ran the same query {n} times, likely N+1: {shape} id={trace.request_id}")
+
+def route_stats() -> Dict[str, dict]:
+    """Per-route totals since startup, for GET /stats."""
+    requests = counters.by_label("db_traced_requests_total", "route")
+    commands = counters.by_label("db_commands_total", "route")
+    db_seconds = counters.by_label("db_time_seconds_total", "route")
+    db_ms = {route: seconds * 1000 for route, seconds in db_seconds.items()}
+    warnings = counters.by_label("db_trace_warnings_total", "route")
+    return {
+        route: {
+            "requests": n,
+            "commands": commands.get(route, 0),
+            "commandsPerRequest": ratio(commands.get(route, 0), n),
+            "dbMs": round(db_ms.get(route, 0), 1),
+            "dbMsPerRequest": ratio(db_ms.get(route, 0), n),
+            "warnings": warnings.get(route, 0),
+        }
+        for route, n in sorted(requests.items())
+    }
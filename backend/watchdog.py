@@ -0,0 +1,94 @@
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from typing import Optional
+
+from metrics import Histogram, counters
+from tracing import trace_of_task
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG_SECONDS = Histogram(
+    "event_loop_lag_seconds", "How late a periodic timer fires on the event loop.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+# Frames of the blocked stack kept in the log (innermost last)
+STACK_DEPTH = 25
+
+class LoopWatchdog:
+    """Measures event-loop lag and reports what is blocking the loop.
+
+    A timer on the loop wakes up every `interval` seconds and records how late
+    it was woken; anything holding the loop (CPU work in a handler, a
+    blocking call) delays it by about as long as it held it. A sampling thread
+    checks that timer: once it is overdue by more than `block_threshold`
+    seconds, the loop thread's current stack is captured and logged with the
+    request (route, request id) whose task is running, once per stall.
+    """
+
+    def __init__(self, interval: float = 0.1, block_threshold: float = 0.25):
+        self.interval = interval
+        self.block_threshold = block_threshold
+        self.last_lag = 0.0
+        self._due = 0.0
+        self._reported_due = 0.0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread = 0
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    async def _tick(self):
+        while True:
+            started = time.perf_counter()
+            self._due = started + self.interval
+            await asyncio.sleep(self.interval)
+            self.last_lag = max(0.0, time.perf_counter() - started - self.interval)
+            LOOP_LAG_SECONDS.observe(self.last_lag)
+
+    def _watch(self):
+        while not self._stopped.wait(self.block_threshold / 2):
+            due = self._due
+            overdue = time.perf_counter() - due
+            if due and overdue > self.block_threshold and due != self._reported_due:
+                self._reported_due = due
+                self.report(overdue)
+
+    def report(self, overdue: float):
+        frame = sys._current_frames().get(self._loop_thread)
+        stack = "".join(traceback.format_stack(frame, limit=STACK_DEPTH)) if frame else "(no frame)\n"
+        try:
+            task = asyncio.current_task(self._loop)
+        except RuntimeError:
+            task = None
+        trace = trace_of_task(task) if task else None
+        route = f"{trace.method} {trace.route}" if trace else "background"
+        counters.inc("event_loop_blocked_total", route=route)
+        logger.warning(
+            f"Event loop blocked for {overdue * 1000:.0f}ms+ in {route}"
+            f"{f' (path {trace.path}, id={trace.request_id})' if trace else ''}, at:\n{stack}"
+        )
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._stopped.clear()
+        self._task = self._loop.create_task(self._tick())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._thread:
+            self._thread.join(timeout=1)
+            self._thread = None
@@ -37,4 +37,22 @@ api.interceptors.response.use(
   }
 );
 
+// Square thumbnail variants the backend renders for stored media
+const THUMBNAIL_SIZES = [48, 128, 512];
+
+// Stored media references ("/api/media/<sha256>") live on the backend origin.
+// Pass the displayed size in px to get the smallest thumbnail that covers it.
+export const mediaUrl = (src, px) => {
+  if (src && src.startsWith('/api/')) {
+    const url = backendUrl.replace(/\/$/, '') + src;
+    if (!px) return url;
+    const variant = THUMBNAIL_SIZES.find(s => s >= px) || THUMBNAIL_SIZES[THUMBNAIL_SIZES.length - 1];
+    return `${url}?size=${variant}`;
+  }
+  return src;
+};
+
+// WebSocket endpoints live next to the REST API ("/api/ws" -> ws(s)://backend/api/ws)
+export const socketUrl = (path) => baseURL.replace(/^http/, 'ws') + path;
+
 export default api;
@@ -1,15 +1,19 @@
 
 import React, { useState, useEffect } from 'react';
 import { User } from 'lucide-react';
+import { mediaUrl } from '../../api/axios';
+
+// Avatars render at roughly twice the fallback icon size
+const displayPx = (size) => size * 2 * (window.devicePixelRatio || 1);
 
 const UserAvatar = ({ src, alt, className, size = 24 }) => {
-  const [imgSrc, setImgSrc] = useState(src);
+  const [imgSrc, setImgSrc] = useState(mediaUrl(src, displayPx(size)));
   const [hasError, setHasError] = useState(false);
 
   useEffect(() => {
-    setImgSrc(src);
+    setImgSrc(mediaUrl(src, displayPx(size)));
     setHasError(false);
-  }, [src]);
+  }, [src, size]);
 
   const handleError = () => {
     setHasError(true);
@@ -7,12 +7,14 @@ import { Label } from '../ui/label';
 import { Upload, Image as ImageIcon, Link as LinkIcon, X, MapPin } from 'lucide-react';
 
 import UserAvatar from '../common/UserAvatar';
+import api from '../../api/axios';
 
 const ProfilePicDialog = ({ isOpen, onClose, currentPic, currentName, currentLocation, onSave }) => {
   const [url, setUrl] = useState(currentPic || '');
   const [name, setName] = useState(currentName || '');
   const [location, setLocation] = useState(currentLocation || '');
   const [error, setError] = useState('');
+  const [uploading, setUploading] = useState(false);
 
   useEffect(() => {
     setUrl(currentPic || '');
@@ -42,7 +44,7 @@ const ProfilePicDialog = ({ isOpen, onClose, currentPic, currentName, currentLoc
     setError('');
   };
 
-  const handleFileChange = (e) => {
+  const handleFileChange = async (e) => {
     const file = e.target.files[0];
     if (file) {
       if (file.size > 5 * 1024 * 1024) { // 5MB limit
@@ -50,12 +52,19 @@ const ProfilePicDialog = ({ isOpen, onClose, currentPic, currentName, currentLoc
           return;
       }
       
-      const reader = new FileReader();
-      reader.onloadend = () => {
-        setUrl(reader.result);
+      // Upload once to the media store; the profile only keeps the returned reference
+      const formData = new FormData();
+      formData.append('file', file);
+      setUploading(true);
+      try {
+        const { data } = await api.post('/media', formData);
+        setUrl(data.url);
         setError('');
-      };
-      reader.readAsDataURL(file);
+      } catch (err) {
+        setError(err.response?.data?.detail || "Upload failed");
+      } finally {
+        setUploading(false);
+      }
     }
   };
 
@@ -155,6 +164,7 @@ const ProfilePicDialog = ({ isOpen, onClose, currentPic, currentName, currentLoc
           </Button>
           <Button 
             onClick={handleSave} 
+            disabled={uploading}
             className="flex-1 bg-primary hover:bg-primary/90 text-primary-foreground shadow-md"
           >
             Save Changes
@@ -1,13 +1,23 @@
 
-import React, { createContext, useContext, useState, useEffect, useCallback } from 'react';
+import React, { createContext, useContext, useState, useEffect, useCallback, useRef } from 'react';
 import { AvailabilityMode, mockUsers } from '../data/mockData';
 import { checkUserAvailability, calculateMatchPercentage } from '../utils/availability';
 import { useToast } from '../hooks/use-toast';
 import { translations } from '../data/translations';
-import api from '../api/axios';
+import api, { socketUrl } from '../api/axios';
 
 const AppContext = createContext();
 
+const byLastMessage = (a, b) => b.lastMessageTime - a.lastMessageTime;
+
+// Apply changed entries (by id) on top of the current list
+const mergeById = (current, changed) => {
+  if (!changed.length) return current;
+  const byId = new Map(current.map(item => [item.id, item]));
+  changed.forEach(item => byId.set(item.id, { ...byId.get(item.id), ...item }));
+  return [...byId.values()];
+};
+
 export const useAppContext = () => useContext(AppContext);
 export const useApp = useAppContext;
 
@@ -71,26 +81,199 @@ export const AppProvider = ({ children }) => {
     initAuth();
   }, []);
 
+  // First call loads everything; later ones only get what changed since the last token
+  const syncToken = useRef(null);
+
+  const applySync = (data) => {
+    if (data.full) {
+        setUsers(data.users);
+        setConversations(data.conversations);
+    } else {
+        setUsers(prev => mergeById(prev, data.users));
+        setConversations(prev => mergeById(prev, data.conversations).sort(byLastMessage));
+    }
+    syncToken.current = data.token;
+  };
+
   const fetchData = async () => {
     try {
-        const [usersRes, convRes] = await Promise.all([
-            api.get('/users'),
-            api.get('/conversations')
-        ]);
-        setUsers(usersRes.data);
-        setConversations(convRes.data);
+        const { data } = await api.get('/sync', {
+            params: syncToken.current ? { since: syncToken.current } : {}
+        });
+        applySync(data);
     } catch (e) {
         console.error("Failed to fetch data", e);
     }
   };
 
-  // Poll for updates (simple real-time simulation)
+  // --- REALTIME ---
+  // Server events arrive over /api/ws, or over the /api/events stream when websockets never
+  // get through (proxies that drop the upgrade). While neither is up we fall back to
+  // long-polling /api/updates, which answers as soon as something changed (204 after 25s of quiet).
+  // Connected clients still resync occasionally for data that isn't pushed (names, pictures, counters).
+  const socketOpen = useRef(false);
+  const eventListeners = useRef(new Set());
+
+  // Lets pages (e.g. the open chat) react to pushed events too
+  const subscribeEvents = useCallback((handler) => {
+    eventListeners.current.add(handler);
+    return () => eventListeners.current.delete(handler);
+  }, []);
+
+  const upsertConversation = (summary) => {
+    setConversations(prev => {
+      const others = prev.filter(c => c.id !== summary.id);
+      return [summary, ...others].sort(byLastMessage);
+    });
+  };
+
+  const handleEvent = (event) => {
+    const { type, data } = event;
+    switch (type) {
+      case 'message.created':
+      case 'conversation.updated':
+        upsertConversation(data.conversation);
+        break;
+      case 'user.mode_changed':
+        setUsers(prev => prev.map(u => u.id === data.user.id ? { ...u, ...data.user } : u));
+        setCurrentUser(prev => prev && prev.id === data.user.id ? { ...prev, ...data.user } : prev);
+        break;
+      case 'rating.applied':
+        setUsers(prev => prev.map(u => u.id === data.userId ? { ...u, approvalRating: data.approvalRating } : u));
+        break;
+      case 'review.added':
+        setUsers(prev => prev.map(u => u.id === data.userId ? { ...u, reviewRating: data.reviewRating, reviewCount: data.reviewCount } : u));
+        break;
+      case 'resync':
+        fetchData(); // The stream couldn't replay what we missed
+        break;
+      default:
+        return; // ping
+    }
+    eventListeners.current.forEach(handler => handler(event));
+  };
+
+  const userId = currentUser?.id;
   useEffect(() => {
-      if (currentUser) {
-          const interval = setInterval(fetchData, 3000); // 3 seconds polling
-          return () => clearInterval(interval);
-      }
-  }, [currentUser]);
+      if (!userId) return;
+      let socket = null;
+      let stream = null;
+      let failedSockets = 0;
+      let stopped = false;
+      let retryDelay = 1000;
+      let reconnectTimer = null;
+      let pollTimer = null;
+      let idleTimer = null;
+      let longPolling = false;
+      const aborter = new AbortController();
+
+      const startPolling = (interval) => {
+          clearInterval(pollTimer);
+          pollTimer = setInterval(fetchData, interval);
+      };
+      const stopPolling = () => {
+          clearInterval(pollTimer);
+          pollTimer = null;
+      };
+      const longPoll = async () => {
+          if (longPolling) return;
+          longPolling = true;
+          while (!stopped && !socketOpen.current) {
+              try {
+                  if (!syncToken.current) {
+                      await fetchData();
+                      if (!syncToken.current) throw new Error("sync failed");
+                      continue;
+                  }
+                  const res = await api.get('/updates', {
+                      params: { since: syncToken.current, timeout: 25 },
+                      signal: aborter.signal,
+                  });
+                  if (res.status === 200) applySync(res.data);
+              } catch (e) {
+                  if (stopped) break;
+                  await new Promise(resolve => setTimeout(resolve, 3000));
+              }
+          }
+          longPolling = false;
+      };
+      // The server pings every 25s; silence for longer means the connection is dead
+      const resetIdleTimer = () => {
+          clearTimeout(idleTimer);
+          idleTimer = setTimeout(() => socket && socket.close(), 60000);
+      };
+
+      const onPushEvent = (e) => {
+          try {
+              handleEvent(JSON.parse(e.data));
+          } catch (err) {
+              console.error("Bad realtime event", err);
+          }
+      };
+
+      // EventSource reconnects by itself, sending Last-Event-ID so the server replays what we missed
+      const connectStream = (token) => {
+          stream = new EventSource(`${api.defaults.baseURL}/events?token=${encodeURIComponent(token)}`);
+          stream.onopen = () => {
+              socketOpen.current = true;
+              startPolling(60000);
+          };
+          stream.onmessage = onPushEvent;
+          stream.onerror = () => {
+              socketOpen.current = false;
+              if (stopped) return;
+              stopPolling();
+              longPoll();
+          };
+      };
+
+      const connect = () => {
+          const token = localStorage.getItem('aviato_token');
+          if (!token) return;
+          if (typeof WebSocket === 'undefined' || failedSockets >= 2) {
+              if (typeof EventSource !== 'undefined') connectStream(token);
+              return;
+          }
+          let opened = false;
+          socket = new WebSocket(socketUrl(`/ws?token=${encodeURIComponent(token)}`));
+          socket.onopen = () => {
+              opened = true;
+              failedSockets = 0;
+              socketOpen.current = true;
+              retryDelay = 1000;
+              startPolling(60000);
+              resetIdleTimer();
+              fetchData(); // Catch up on anything missed while disconnected
+          };
+          socket.onmessage = (e) => {
+              resetIdleTimer();
+              onPushEvent(e);
+          };
+          socket.onclose = () => {
+              socketOpen.current = false;
+              clearTimeout(idleTimer);
+              if (stopped) return;
+              if (!opened) failedSockets += 1;
+              stopPolling();
+              longPoll();
+              reconnectTimer = setTimeout(connect, retryDelay);
+              retryDelay = Math.min(retryDelay * 2, 30000);
+          };
+      };
+
+      longPoll();
+      connect();
+      return () => {
+          stopped = true;
+          socketOpen.current = false;
+          aborter.abort();
+          stopPolling();
+          clearTimeout(reconnectTimer);
+          clearTimeout(idleTimer);
+          if (socket) socket.close();
+          if (stream) stream.close();
+      };
+  }, [userId]);
 
 
   // Theme Handling
@@ -161,6 +344,7 @@ export const AppProvider = ({ children }) => {
 
   const logout = () => {
     setCurrentUser(null);
+    syncToken.current = null;
     setConversations([]);
     setCurrentSelections([]);
     localStorage.removeItem('aviato_token');
@@ -210,11 +394,9 @@ export const AppProvider = ({ children }) => {
     if (!currentUser) return;
     try {
         // Optimistic Update for Conversations
-        const tempId = Date.now().toString();
-        
         // Check if this is the first message to handle Orange Mode counter optimistically
         const targetConversation = conversations.find(c => c.userId === userId);
-        const isFirstMessage = !targetConversation || !targetConversation.messages || targetConversation.messages.length === 0;
+        const isFirstMessage = !targetConversation || !targetConversation.messageCount;
 
         // If it's the first message and target is Orange Mode, increment their count locally
         let previousUsersState = null;
@@ -244,17 +426,12 @@ export const AppProvider = ({ children }) => {
         setConversations(prev => {
             const updated = prev.map(c => {
                 if (c.userId === userId) {
+                    // Summary only; ChatPage keeps the message itself
                     return {
                         ...c,
-                        messages: [...c.messages, {
-                            id: tempId,
-                            senderId: currentUser.id,
-                            text,
-                            timestamp: Date.now(),
-                            read: false
-                        }],
+                        messageCount: (c.messageCount || 0) + 1,
                         lastMessage: text,
-                        lastMessageTime: Date.now()
+                        lastMessageSenderId: currentUser.id
                     };
                 }
                 return c;
@@ -265,10 +442,14 @@ export const AppProvider = ({ children }) => {
 
         await api.post(`/conversations/${userId}/messages`, { text });
         
-        // Slight delay to allow backend dynamic count to update in DB before refetching
-        setTimeout(() => {
-            fetchData();
-        }, 500);
+        // Without the socket, refetch to pick up the server's view (e.g. Orange counters)
+        if (!socketOpen.current) {
+            // Slight delay to allow backend dynamic count to update in DB before refetching
+            setTimeout(() => {
+                fetchData();
+            }, 500);
+        }
+        return true;
     } catch (e) {
         console.error(e);
         // Revert users state if failed (e.g. 403 Blocked) to prevent "3/2" display
@@ -281,6 +462,7 @@ export const AppProvider = ({ children }) => {
              msg = e.response.data.detail || "Limit reached";
         }
         showToast(msg, "error");
+        return false;
     }
   };
   
@@ -340,9 +522,11 @@ export const AppProvider = ({ children }) => {
         await api.post(`/users/${userId}/reviews`, review);
         showToast(`Review submitted: ${rating} stars`, 'success');
         await fetchData();
+        return true;
     } catch (e) {
         console.error(e);
         showToast("Failed to submit review", "error");
+        return false;
     }
   }, [currentUser, showToast]);
 
@@ -398,7 +582,7 @@ export const AppProvider = ({ children }) => {
     markConversationRated, updateUserApproval, rateConversation, submitReview, getConversation, 
     updateProfilePic, updateProfileName, updateProfileLocation, updateUserProfile,
     setAvailabilityMode, getCurrentMode, theme, setTheme, deleteAllChats, showToast, setSelections, updateUserSelections,
-    language, setLanguage, t 
+    language, setLanguage, t, subscribeEvents
   };
 
   return <AppContext.Provider value={value}>{children}</AppContext.Provider>;
@@ -0,0 +1,100 @@
+import { useState, useEffect, useCallback, useRef } from 'react';
+import api from '../api/axios';
+import { useAppContext } from '../contexts/AppContext';
+
+const PAGE_SIZE = 50;
+
+const mergeMessages = (current, incoming) => {
+  const byId = new Map(current.map(m => [m.id, m]));
+  incoming.forEach(m => byId.set(m.id, m));
+  return [...byId.values()].sort((a, b) => a.timestamp - b.timestamp);
+};
+
+// Message history of one conversation. The conversation list only carries
+// summaries, so the newest page is (re)fetched whenever its lastMessageTime moves
+// (unless the message already arrived over the socket), and older pages are
+// loaded on demand.
+export function useConversationMessages(conversation) {
+  const conversationId = conversation?.id;
+  const lastMessageTime = conversation?.lastMessageTime;
+  const [messages, setMessages] = useState([]);
+  const [olderCursor, setOlderCursor] = useState(null);
+  const [loadingOlder, setLoadingOlder] = useState(false);
+  const firstPageLoaded = useRef(false);
+  const pushedUpTo = useRef(0);
+  const { subscribeEvents } = useAppContext();
+
+  useEffect(() => {
+    setMessages([]);
+    setOlderCursor(null);
+    firstPageLoaded.current = false;
+    pushedUpTo.current = 0;
+  }, [conversationId]);
+
+  useEffect(() => {
+    if (!conversationId || !subscribeEvents) return;
+    return subscribeEvents(({ type, data }) => {
+      if (type !== 'message.created' || data.conversation.id !== conversationId) return;
+      const message = data.message;
+      pushedUpTo.current = Math.max(pushedUpTo.current, message.timestamp);
+      setMessages(prev => {
+        // Our own send comes back too: it replaces the optimistic copy
+        const pending = prev.find(m => m.pending && m.senderId === message.senderId && m.text === message.text);
+        return mergeMessages(prev.filter(m => m !== pending), [message]);
+      });
+    });
+  }, [conversationId, subscribeEvents]);
+
+  useEffect(() => {
+    if (!conversationId) return;
+    if (firstPageLoaded.current && lastMessageTime <= pushedUpTo.current) return;
+    let cancelled = false;
+    api.get(`/conversations/${conversationId}/messages`, { params: { limit: PAGE_SIZE } })
+      .then(({ data }) => {
+        if (cancelled) return;
+        // Server copies replace optimistic ones
+        setMessages(prev => mergeMessages(prev.filter(m => !m.pending), data.messages));
+        if (!firstPageLoaded.current) {
+          firstPageLoaded.current = true;
+          setOlderCursor(data.nextBefore);
+        }
+      })
+      .catch(e => console.error("Failed to load messages", e));
+    return () => { cancelled = true; };
+  }, [conversationId, lastMessageTime]);
+
+  const loadOlder = useCallback(async () => {
+    if (!conversationId || !olderCursor || loadingOlder) return false;
+    setLoadingOlder(true);
+    try {
+      const { data } = await api.get(`/conversations/${conversationId}/messages`, {
+        params: { limit: PAGE_SIZE, before: olderCursor }
+      });
+      setMessages(prev => mergeMessages(prev, data.messages));
+      setOlderCursor(data.nextBefore);
+      return true;
+    } catch (e) {
+      console.error("Failed to load older messages", e);
+      return false;
+    } finally {
+      setLoadingOlder(false);
+    }
+  }, [conversationId, olderCursor, loadingOlder]);
+
+  const addPendingMessage = useCallback((message) => {
+    setMessages(prev => [...prev, { ...message, pending: true }]);
+  }, []);
+
+  const removePendingMessage = useCallback((id) => {
+    setMessages(prev => prev.filter(m => m.id !== id));
+  }, []);
+
+  return {
+    messages,
+    hasOlder: !!olderCursor,
+    loadingOlder,
+    loadOlder,
+    addPendingMessage,
+    removePendingMessage,
+  };
+}
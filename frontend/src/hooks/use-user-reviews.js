@@ -0,0 +1,58 @@
+import { useState, useEffect, useCallback } from 'react';
+import api from '../api/axios';
+
+const PAGE_SIZE = 20;
+
+const mergeReviews = (current, incoming) => {
+  const byRater = new Map(current.map(r => [r.raterId, r]));
+  incoming.forEach(r => byRater.set(r.raterId, r));
+  return [...byRater.values()].sort((a, b) => b.timestamp - a.timestamp);
+};
+
+// Reviews of one user, newest first. The first page is (re)loaded whenever
+// `version` changes (pass something that moves with the user's reviews, like
+// their reviewCount and the caller's own rating), dropping older pages;
+// those load on demand.
+export function useUserReviews(userId, version) {
+  const [reviews, setReviews] = useState([]);
+  const [olderCursor, setOlderCursor] = useState(null);
+  const [loading, setLoading] = useState(false);
+
+  useEffect(() => {
+    setReviews([]);
+    setOlderCursor(null);
+  }, [userId]);
+
+  useEffect(() => {
+    if (!userId) return;
+    let cancelled = false;
+    setLoading(true);
+    api.get(`/users/${userId}/reviews`, { params: { limit: PAGE_SIZE } })
+      .then(({ data }) => {
+        if (cancelled) return;
+        setReviews(data.reviews);
+        setOlderCursor(data.nextBefore);
+      })
+      .catch(e => console.error("Failed to load reviews", e))
+      .finally(() => { if (!cancelled) setLoading(false); });
+    return () => { cancelled = true; };
+  }, [userId, version]);
+
+  const loadOlder = useCallback(async () => {
+    if (!userId || !olderCursor || loading) return;
+    setLoading(true);
+    try {
+      const { data } = await api.get(`/users/${userId}/reviews`, {
+        params: { limit: PAGE_SIZE, before: olderCursor }
+      });
+      setReviews(prev => mergeReviews(prev, data.reviews));
+      setOlderCursor(data.nextBefore);
+    } catch (e) {
+      console.error("Failed to load older reviews", e);
+    } finally {
+      setLoading(false);
+    }
+  }, [userId, olderCursor, loading]);
+
+  return { reviews, hasOlder: !!olderCursor, loading, loadOlder };
+}
@@ -8,6 +8,7 @@ import { Input } from '../components/ui/input';
 import { Button } from '../components/ui/button';
 import ModeIndicator from '../components/availability/ModeIndicator';
 import { checkUserAvailability } from '../utils/availability';
+import { useConversationMessages } from '../hooks/use-conversation-messages';
 
 // Popular emojis organized by category
 const EMOJI_CATEGORIES = {
@@ -40,9 +41,11 @@ const ChatPage = () => {
   const [selectedCategory, setSelectedCategory] = useState('Smileys');
   const scrollRef = useRef(null);
   const emojiPickerRef = useRef(null);
+  const prependAnchor = useRef(null);
   
   const otherUser = getUserById ? getUserById(userId) : null;
   const conversation = getConversation ? getConversation(userId) : null;
+  const { messages, hasOlder, loadOlder, addPendingMessage, removePendingMessage } = useConversationMessages(conversation);
   const availabilityStatus = otherUser ? checkUserAvailability(otherUser) : { available: false, reason: 'Offline' };
   
   // Logic: 
@@ -50,7 +53,7 @@ const ChatPage = () => {
   // 2. If Orange Mode AND existing chat -> YES (Bypass limit for existing participants)
   // 3. If Blue/Red/Gray/Brown -> NO (Strict blocking logic applies universally, overriding existing chats)
   
-  const hasExistingChat = conversation && conversation.messages && conversation.messages.length > 0;
+  const hasExistingChat = conversation && conversation.messageCount > 0;
   const isOrangeBypass = otherUser?.availabilityMode === 'orange' && hasExistingChat;
   
   const canMessage = availabilityStatus.available || isOrangeBypass;
@@ -162,9 +165,26 @@ const ChatPage = () => {
     // does not include the previous mock auto-reply logic.
   }, []);
 
+  // Stick to the bottom for new messages; keep the view in place when older ones are prepended
+  const lastMessageId = messages.length ? messages[messages.length - 1].id : null;
   useEffect(() => {
     if (scrollRef.current) scrollRef.current.scrollTop = scrollRef.current.scrollHeight;
-  }, [conversation?.messages]);
+  }, [lastMessageId]);
+
+  useEffect(() => {
+    const el = scrollRef.current;
+    if (el && prependAnchor.current !== null) {
+      el.scrollTop = el.scrollHeight - prependAnchor.current;
+      prependAnchor.current = null;
+    }
+  }, [messages]);
+
+  const handleScroll = async () => {
+    const el = scrollRef.current;
+    if (!el || el.scrollTop > 40 || !hasOlder) return;
+    prependAnchor.current = el.scrollHeight - el.scrollTop;
+    if (!(await loadOlder())) prependAnchor.current = null;
+  };
 
   const formatTime = (ms) => {
     if (isNaN(ms) || ms < 0) return "00:00"; 
@@ -210,10 +230,14 @@ const ChatPage = () => {
     // After rating, timer logic will see conversation.rated = true and set 00:00
   }, [rateConversation, userId]);
 
-  const handleSendMessage = () => {
+  const handleSendMessage = async () => {
     if (!text.trim() || !canMessage) return;
-    if (sendMessage) sendMessage(userId, text);
+    const pendingId = `pending-${Date.now()}`;
+    addPendingMessage({ id: pendingId, senderId: currentUser?.id, text, timestamp: Date.now(), read: false });
     setText('');
+    if (sendMessage && !(await sendMessage(userId, text))) {
+      removePendingMessage(pendingId);
+    }
   };
 
   if (!otherUser) return <div className="flex items-center justify-center h-screen bg-background text-foreground">Loading...</div>;
@@ -300,14 +324,14 @@ const ChatPage = () => {
           </div>
       )}
 
-      <div className="flex-1 overflow-y-auto p-4 space-y-4 bg-muted/30" ref={scrollRef}>
-        {(!conversation?.messages || conversation.messages.length === 0) && (
+      <div className="flex-1 overflow-y-auto p-4 space-y-4 bg-muted/30" ref={scrollRef} onScroll={handleScroll}>
+        {messages.length === 0 && !hasExistingChat && (
            <div className="text-center text-muted-foreground text-sm mt-10">
              Start a conversation with {otherUser.name}.<br/>
              {conversation?.timerStarted ? 'Timer is running!' : 'Timer starts when you send a message.'}
            </div>
         )}
-        {conversation?.messages?.map((msg) => {
+        {messages.map((msg) => {
           const isMe = msg.senderId === currentUser?.id;
           return (
             <div key={msg.id} className={`flex ${isMe ? 'justify-end' : 'justify-start'}`}>
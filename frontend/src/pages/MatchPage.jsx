@@ -73,7 +73,7 @@ export default function MatchPage() {
   // Check if we have an existing active conversation with a user
   const hasActiveChat = (userId) => {
       const conv = (conversations || []).find(c => c.userId === userId);
-      return conv && conv.messages && conv.messages.length > 0;
+      return conv && conv.messageCount > 0;
   };
 
   const handleMessage = (userId) => {
@@ -172,7 +172,7 @@ export default function MatchPage() {
               user={user} 
               onMessage={() => handleMessage(user.id)} 
               t={t}
-              hasExistingChat={conversations.some(c => c.userId === user.id && c.messages && c.messages.length > 0)}
+              hasExistingChat={conversations.some(c => c.userId === user.id && c.messageCount > 0)}
             />
           ))
         )}
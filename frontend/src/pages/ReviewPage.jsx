@@ -1,8 +1,10 @@
 
-import React, { useState } from 'react';
+import React, { useState, useEffect } from 'react';
 import { Search, Star, ChevronDown, ChevronUp, MessageSquare } from 'lucide-react';
 import { useNavigate } from 'react-router-dom';
 import { useAppContext } from '../contexts/AppContext';
+import { useUserReviews } from '../hooks/use-user-reviews';
+import api from '../api/axios';
 import { Input } from '../components/ui/input';
 import { Button } from '../components/ui/button';
 import ModeIndicator from '../components/availability/ModeIndicator';
@@ -11,29 +13,114 @@ import { useTranslation } from 'react-i18next';
 
 import UserAvatar from '../components/common/UserAvatar';
 
+// Who rated one user, paged from the server; the search covers the loaded pages
+const UserReviewList = ({ user, myRating, currentUserId, onRaterClick }) => {
+  const { t } = useTranslation();
+  const [reviewsSearchTerm, setReviewsSearchTerm] = useState('');
+  const { reviews: userReviews, hasOlder, loading, loadOlder } = useUserReviews(user.id, `${user.reviewCount}:${myRating}`);
+  const matchingReviews = userReviews.filter(r =>
+    !reviewsSearchTerm ||
+    r.raterName.toLowerCase().includes(reviewsSearchTerm.toLowerCase())
+  );
+
+  return (
+    <div className="space-y-2">
+        {/* Reviews Search Input */}
+        {userReviews.length > 0 && (
+          <div className="relative mb-3">
+              <Search className="absolute left-2.5 top-2.5 h-3.5 w-3.5 text-muted-foreground" />
+              <Input
+                  placeholder={t('review.search_raters', { defaultValue: 'Search raters...' })}
+                  value={reviewsSearchTerm}
+                  onChange={(e) => setReviewsSearchTerm(e.target.value)}
+                  className="pl-8 h-9 text-sm bg-background"
+              />
+          </div>
+        )}
+
+        {userReviews.length === 0 ? (
+            <p className="text-sm text-muted-foreground italic">{loading ? 'Loading reviews...' : 'No reviews yet.'}</p>
+        ) : (
+            matchingReviews.map(review => (
+                <div 
+                  key={review.raterId} 
+                  onClick={() => onRaterClick(review.raterId)}
+                  className={`flex justify-between items-center text-sm p-2 bg-card rounded-lg border border-border shadow-sm transition-colors ${
+                      review.raterId !== currentUserId ? 'cursor-pointer hover:bg-accent hover:border-primary/30' : ''
+                  }`}
+                >
+                    <div className="flex items-center gap-2">
+                      <UserAvatar 
+                        src={review.raterProfilePic} 
+                        alt={review.raterName} 
+                        className="w-6 h-6 rounded-full"
+                        size={12}
+                      />
+                      <span className="text-foreground font-medium flex items-center gap-1.5">
+                          {review.raterId === currentUserId ? "You" : review.raterName}
+                          {review.raterId !== currentUserId && (
+                              <MessageSquare className="w-3 h-3 text-muted-foreground opacity-50" />
+                          )}
+                      </span>
+                    </div>
+                    <div className="flex items-center gap-1">
+                        <span className="text-yellow-600 font-bold">{review.rating}</span>
+                        <Star className="w-3 h-3 text-yellow-500 fill-current" />
+                    </div>
+                </div>
+            ))
+        )}
+        
+        {/* Empty state for filtered search */}
+        {userReviews.length > 0 && matchingReviews.length === 0 && (
+            <p className="text-sm text-muted-foreground italic text-center py-2">No matching reviews found.</p>
+        )}
+
+        {hasOlder && (
+            <Button variant="ghost" size="sm" className="w-full h-8 text-muted-foreground" disabled={loading} onClick={loadOlder}>
+                Show more
+            </Button>
+        )}
+    </div>
+  );
+};
+
 const ReviewPage = () => {
   const navigate = useNavigate();
   const { users, currentUser, submitReview } = useAppContext();
   const { t } = useTranslation();
   const [searchTerm, setSearchTerm] = useState('');
-  const [reviewsSearchTerm, setReviewsSearchTerm] = useState('');
   const [selectedUser, setSelectedUser] = useState(null);
   const [expandedUserId, setExpandedUserId] = useState(null);
+  // My rating of each user I've reviewed, by user id
+  const [givenRatings, setGivenRatings] = useState({});
+
+  useEffect(() => {
+    if (!currentUser?.id) return;
+    api.get('/reviews/given')
+      .then(({ data }) => setGivenRatings(data.ratings))
+      .catch(e => console.error("Failed to load given reviews", e));
+  }, [currentUser?.id]);
+
+  // Who rated me; refetched when my review count moves
+  const myReviewCount = users.find(u => u.id === currentUser?.id)?.reviewCount ?? currentUser?.reviewCount;
+  const { reviews: myReviews, hasOlder: myReviewsHasOlder, loading: myReviewsLoading, loadOlder: loadOlderMyReviews } =
+    useUserReviews(currentUser?.id, myReviewCount);
   
   // Filter users to only show those we've "chatted" with (mocked as all users for now minus self)
   // Logic moved inside component body for 'filteredUsers'
   const rateableUsers = users.filter(u => u.id !== currentUser?.id);
 
-  const handleRateSubmit = (rating) => {
-    if (selectedUser) {
-        submitReview(selectedUser.id, rating);
-    }
+  const handleRateSubmit = async (rating) => {
+    const target = selectedUser;
     setSelectedUser(null);
+    if (target && await submitReview(target.id, rating)) {
+        setGivenRatings(prev => ({ ...prev, [target.id]: rating }));
+    }
   };
   
   const toggleExpanded = (userId) => {
     setExpandedUserId(expandedUserId === userId ? null : userId);
-    setReviewsSearchTerm(''); // Reset search when toggling
   };
 
   const handleRaterClick = (raterId) => {
@@ -46,8 +133,8 @@ const ReviewPage = () => {
   const [filterTab, setFilterTab] = useState('all'); // 'all', 'rated', 'not_rated'
   // Calculate counts for tabs
   const allCount = rateableUsers.length;
-  const ratedCount = rateableUsers.filter(u => u.reviews?.some(r => r.raterId === currentUser?.id)).length;
-  const notRatedCount = rateableUsers.filter(u => !u.reviews?.some(r => r.raterId === currentUser?.id)).length;
+  const ratedCount = rateableUsers.filter(u => u.id in givenRatings).length;
+  const notRatedCount = allCount - ratedCount;
 
   // Filter users
   const filteredUsers = rateableUsers.filter(user => {
@@ -55,7 +142,7 @@ const ReviewPage = () => {
     if (!user.name.toLowerCase().includes(searchTerm.toLowerCase())) return false;
 
     // Tab Filter
-    const hasRated = user.reviews?.some(r => r.raterId === currentUser?.id);
+    const hasRated = user.id in givenRatings;
     if (filterTab === 'rated' && !hasRated) return false;
     if (filterTab === 'not_rated' && hasRated) return false;
 
@@ -69,10 +156,10 @@ const ReviewPage = () => {
       {/* Who Rated Me Section */}
       <div className="mb-6">
         <h2 className="text-lg font-bold text-foreground mb-2">Who Rated Me</h2>
-        {currentUser?.reviews && currentUser.reviews.length > 0 ? (
+        {myReviews.length > 0 ? (
             <div className="flex gap-3 overflow-x-auto pb-2 scrollbar-hide">
-                {currentUser.reviews.map((review, idx) => (
-                    <div key={idx} className="bg-card border border-border rounded-lg p-3 min-w-[140px] shadow-sm flex flex-col gap-2">
+                {myReviews.map(review => (
+                    <div key={review.raterId} className="bg-card border border-border rounded-lg p-3 min-w-[140px] shadow-sm flex flex-col gap-2">
                         <div className="flex items-center gap-2">
                             <UserAvatar src={review.raterProfilePic} alt={review.raterName} className="w-8 h-8 rounded-full" size={16} />
                             <div className="flex flex-col overflow-hidden">
@@ -84,10 +171,15 @@ const ReviewPage = () => {
                         </div>
                     </div>
                 ))}
+                {myReviewsHasOlder && (
+                    <Button variant="ghost" size="sm" className="min-w-[100px] h-auto self-stretch text-muted-foreground" disabled={myReviewsLoading} onClick={loadOlderMyReviews}>
+                        Show more
+                    </Button>
+                )}
             </div>
         ) : (
             <div className="p-4 bg-muted/30 border border-dashed border-border rounded-xl text-center">
-                <p className="text-sm text-muted-foreground">No one has rated you yet.</p>
+                <p className="text-sm text-muted-foreground">{myReviewsLoading ? 'Loading...' : 'No one has rated you yet.'}</p>
             </div>
         )}
       </div>
@@ -133,8 +225,7 @@ const ReviewPage = () => {
       <div className="space-y-3">
         {filteredUsers.map(user => {
           // Check if current user has already rated this user
-          const hasRated = user.reviews?.some(r => r.raterId === currentUser?.id);
-          const userReviews = user.reviews || [];
+          const hasRated = user.id in givenRatings;
 
           return (
             <div key={user.id} className="bg-card rounded-xl shadow-sm border border-border overflow-hidden">
@@ -161,7 +252,7 @@ const ReviewPage = () => {
                 
                 <div className="flex items-center gap-2">
                     {/* Show toggle if user has reviews (or if user has rated them) */}
-                    {(userReviews.length > 0 || hasRated) && (
+                    {(user.reviewCount > 0 || hasRated) && (
                         <Button
                             variant="ghost"
                             size="icon"
@@ -193,63 +284,12 @@ const ReviewPage = () => {
                       {!hasRated ? (
                           <p className="text-sm text-muted-foreground italic">Rate this user to see who else has reviewed them.</p>
                       ) : (
-                          <div className="space-y-2">
-                              {/* Reviews Search Input */}
-                              {userReviews.length > 0 && (
-                                <div className="relative mb-3">
-                                    <Search className="absolute left-2.5 top-2.5 h-3.5 w-3.5 text-muted-foreground" />
-                                    <Input
-                                        placeholder={t('review.search_raters', { defaultValue: 'Search raters...' })}
-                                        value={reviewsSearchTerm}
-                                        onChange={(e) => setReviewsSearchTerm(e.target.value)}
-                                        className="pl-8 h-9 text-sm bg-background"
-                                    />
-                                </div>
-                              )}
-
-                              {userReviews.length === 0 ? (
-                                  <p className="text-sm text-muted-foreground italic">No reviews yet.</p>
-                              ) : (
-                                  userReviews
-                                    .filter(r => 
-                                        !reviewsSearchTerm || 
-                                        r.raterName.toLowerCase().includes(reviewsSearchTerm.toLowerCase())
-                                    )
-                                    .map((review, idx) => (
-                                      <div 
-                                        key={idx} 
-                                        onClick={() => handleRaterClick(review.raterId)}
-                                        className={`flex justify-between items-center text-sm p-2 bg-card rounded-lg border border-border shadow-sm transition-colors ${
-                                            review.raterId !== currentUser?.id ? 'cursor-pointer hover:bg-accent hover:border-primary/30' : ''
-                                        }`}
-                                      >
-                                          <div className="flex items-center gap-2">
-                                            <UserAvatar 
-                                              src={review.raterProfilePic} 
-                                              alt={review.raterName} 
-                                              className="w-6 h-6 rounded-full"
-                                              size={12}
-                                            />
-                                            <span className="text-foreground font-medium flex items-center gap-1.5">
-                                                {review.raterId === currentUser?.id ? "You" : review.raterName}
-                                                {review.raterId !== currentUser?.id && (
-                                                    <MessageSquare className="w-3 h-3 text-muted-foreground opacity-50" />
-                                                )}
-                                            </span>
-                                          </div>
-                                          <div className="flex items-center gap-1">
-                                              <span className="text-yellow-600 font-bold">{review.rating}</span>
-                                              <Star className="w-3 h-3 text-yellow-500 fill-current" />
-                                          </div>
-                                      </div>
-                                  ))
-                              )}
-                              
-                              {/* Empty state for filtered search */}
-                              {userReviews.length > 0 && userReviews.filter(r => !reviewsSearchTerm || r.raterName.toLowerCase().includes(reviewsSearchTerm.toLowerCase())).length === 0 && (
-                                  <p className="text-sm text-muted-foreground italic text-center py-2">No matching reviews found.</p>
-                              )}
-                          </div>
+                          <UserReviewList
+                            user={user}
+                            myRating={givenRatings[user.id]}
+                            currentUserId={currentUser?.id}
+                            onRaterClick={handleRaterClick}
+                          />
                       )}
                   </div>
               )}
@@ -134,7 +134,7 @@ class KineticBackendTester:
             # Check if users have required fields for review functionality
             if users:
                 user = users[0]
-                required_fields = ['id', 'name', 'reviews', 'reviewRating', 'reviewCount']
+                required_fields = ['id', 'name', 'reviewRating', 'reviewCount']
                 missing_fields = [field for field in required_fields if field not in user]
                 if missing_fields:
                     print(f"   ⚠️  Missing fields in user data: {missing_fields}")
@@ -154,7 +154,7 @@ class KineticBackendTester:
         if success:
             user = response
             print(f"   Current user: {user.get('name')} ({user.get('email')})")
-            print(f"   Reviews received: {len(user.get('reviews', []))}")
+            print(f"   Reviews received: {user.get('reviewCount', 0)}")
             return user
         return None
 
@@ -178,6 +178,23 @@ class KineticBackendTester:
         )
         return success
 
+    def test_get_reviews(self, target_user_id):
+        """Test paging through a user's reviews"""
+        success, response = self.run_test(
+            f"Get reviews of user {target_user_id}",
+            "GET",
+            f"api/users/{target_user_id}/reviews?limit=20",
+            200
+        )
+        if success:
+            reviews = response.get('reviews', [])
+            print(f"   Found {len(reviews)} reviews")
+            if any(r.get('raterId') == self.current_user.get('id') for r in reviews):
+                print(f"   ✅ Our review is listed")
+            else:
+                print(f"   ⚠️  Our review is missing from the first page")
+        return success
+
 def main():
     print("🚀 Starting Kinetic (Review Page) Backend Tests...")
     
@@ -208,7 +225,8 @@ def main():
         if target_users:
             target_user = target_users[0]
             print(f"\n   Testing review with user: {target_user.get('name')}")
-            tester.test_add_review(target_user.get('id'))
+            if tester.test_add_review(target_user.get('id')):
+                tester.test_get_reviews(target_user.get('id'))
         else:
             print("   ⚠️  No other users available to test reviews")
     else:
@@ -313,11 +313,11 @@ def main():
             tester.log("❌ User 1 should have conversation with orange user")
             return 1
             
-        if not orange_conv.get('messages') or len(orange_conv['messages']) == 0:
+        if not orange_conv.get('messageCount'):
             tester.log("❌ Conversation should have messages")
             return 1
         else:
-            tester.log(f"✅ User 1 has active conversation with {len(orange_conv['messages'])} messages")
+            tester.log(f"✅ User 1 has active conversation with {orange_conv['messageCount']} messages")
             
         # Verify User 2 can view but not send
         tester.log("\n📋 VERIFICATION: User 2 can view but not send")
@@ -331,7 +331,7 @@ def main():
                 break
                 
         if orange_conv_user2:
-            tester.log(f"✅ User 2 has conversation (view mode) with {len(orange_conv_user2.get('messages', []))} messages")
+            tester.log(f"✅ User 2 has conversation (view mode) with {orange_conv_user2.get('messageCount', 0)} messages")
         else:
             tester.log("✅ User 2 has no conversation (as expected for view-only mode)")
             
@@ -112,6 +112,16 @@ class RatingModalDoubleShowTest:
         )
         return success, response
 
+    def test_get_messages(self, conversation_id):
+        """Test getting a conversation's message history"""
+        success, response = self.run_test(
+            f"Get Messages of Conversation {conversation_id}",
+            "GET",
+            f"api/conversations/{conversation_id}/messages",
+            200
+        )
+        return success, response
+
 def main():
     print("🎯 Starting Rating Modal Double Show Fix Test")
     print("=" * 60)
@@ -235,7 +245,8 @@ def main():
     
     # Test 9: Verify messages are present
     print("\n📋 Test 9: Verify both messages are present in conversation")
-    messages = john_conversation_after_second_msg.get('messages', [])
+    success, response = tester.test_get_messages(john_conversation_after_second_msg['id'])
+    messages = response.get('messages', []) if success else []
     message_texts = [msg.get('text', '') for msg in messages]
     
     expected_messages = [